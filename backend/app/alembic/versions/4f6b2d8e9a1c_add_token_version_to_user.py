@@ -0,0 +1,28 @@
+"""Add token_version to user
+
+Revision ID: 4f6b2d8e9a1c
+Revises: 1a31ce608336
+Create Date: 2026-10-18 09:12:41.305118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '4f6b2d8e9a1c'
+down_revision = '1a31ce608336'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'user',
+        sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+
+def downgrade():
+    op.drop_column('user', 'token_version')
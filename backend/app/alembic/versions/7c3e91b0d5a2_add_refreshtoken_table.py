@@ -0,0 +1,37 @@
+"""Add refreshtoken table
+
+Revision ID: 7c3e91b0d5a2
+Revises: 4f6b2d8e9a1c
+Create Date: 2026-10-18 10:03:17.582910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e91b0d5a2'
+down_revision = '4f6b2d8e9a1c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'refreshtoken',
+        sa.Column('token_hash', sa.LargeBinary(), nullable=False),
+        sa.Column('user_id', sa.Uuid(), nullable=False),
+        sa.Column('token_version', sa.Integer(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('token_hash'),
+    )
+    op.create_index(op.f('ix_refreshtoken_expires_at'), 'refreshtoken', ['expires_at'], unique=False)
+    op.create_index(op.f('ix_refreshtoken_user_id'), 'refreshtoken', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_refreshtoken_user_id'), table_name='refreshtoken')
+    op.drop_index(op.f('ix_refreshtoken_expires_at'), table_name='refreshtoken')
+    op.drop_table('refreshtoken')
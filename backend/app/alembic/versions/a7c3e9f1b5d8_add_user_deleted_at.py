@@ -0,0 +1,64 @@
+"""Add user deleted_at
+
+Revision ID: a7c3e9f1b5d8
+Revises: f5b1d3e7a9c2
+Create Date: 2026-10-18 19:12:37.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9f1b5d8'
+down_revision = 'f5b1d3e7a9c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+    # The items of users being deleted are purged in batches, they don't
+    # leave tombstones either
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION item_deleted() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO item_tombstone (id, owner_id, change_xid, change_seq)
+            SELECT
+                deleted_item.id,
+                deleted_item.owner_id,
+                pg_current_xact_id()::text::bigint,
+                nextval('item_change_seq')
+            FROM deleted_item
+            WHERE EXISTS (
+                SELECT FROM "user"
+                WHERE "user".id = deleted_item.owner_id AND "user".deleted_at IS NULL
+            );
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION item_deleted() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO item_tombstone (id, owner_id, change_xid, change_seq)
+            SELECT
+                deleted_item.id,
+                deleted_item.owner_id,
+                pg_current_xact_id()::text::bigint,
+                nextval('item_change_seq')
+            FROM deleted_item
+            WHERE EXISTS (SELECT FROM "user" WHERE "user".id = deleted_item.owner_id);
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    op.drop_column('user', 'deleted_at')
@@ -0,0 +1,37 @@
+"""Add item (owner_id, id) index
+
+Revision ID: b5d8e2f4a6c1
+Revises: 7c3e91b0d5a2
+Create Date: 2026-10-18 11:24:51.310245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d8e2f4a6c1'
+down_revision = '7c3e91b0d5a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY doesn't lock out writes to item while the index is built,
+    # it can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_item_owner_id_id',
+            'item',
+            ['owner_id', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_item_owner_id_id', table_name='item', postgresql_concurrently=True
+        )
@@ -0,0 +1,43 @@
+"""Lower case user emails
+
+Revision ID: b9e5a1c7d3f6
+Revises: a7c3e9f1b5d8
+Create Date: 2026-10-18 20:03:18.925640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e5a1c7d3f6'
+down_revision = 'a7c3e9f1b5d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Accounts whose emails only differ in case have to be merged or deleted
+    # by hand first, which one to keep can't be decided here
+    op.execute(
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT FROM "user" GROUP BY lower(email) HAVING count(*) > 1
+            ) THEN
+                RAISE EXCEPTION 'Several users have the same email in different cases';
+            END IF;
+        END
+        $$
+        """
+    )
+    op.execute('UPDATE "user" SET email = lower(email) WHERE email <> lower(email)')
+    op.create_index('ix_user_email_lower', 'user', [sa.text('lower(email)')], unique=True)
+    op.drop_index('ix_user_email', table_name='user')
+
+
+def downgrade():
+    op.create_index('ix_user_email', 'user', ['email'], unique=True)
+    op.drop_index('ix_user_email_lower', table_name='user')
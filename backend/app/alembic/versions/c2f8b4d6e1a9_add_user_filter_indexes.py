@@ -0,0 +1,75 @@
+"""Add user filter indexes
+
+Revision ID: c2f8b4d6e1a9
+Revises: b9e5a1c7d3f6
+Create Date: 2026-10-18 21:26:50.148372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f8b4d6e1a9'
+down_revision = 'b9e5a1c7d3f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm is created by the item search migration. CONCURRENTLY doesn't
+    # lock out writes to user while the indexes are built, it can't run inside
+    # a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_email_pattern',
+            'user',
+            ['email'],
+            unique=False,
+            postgresql_ops={'email': 'varchar_pattern_ops'},
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_user_email_trgm',
+            'user',
+            ['email'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'email': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_user_full_name_trgm',
+            'user',
+            ['full_name'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'full_name': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_user_superuser_id',
+            'user',
+            ['id'],
+            unique=False,
+            postgresql_where=sa.text('is_superuser'),
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_user_inactive_id',
+            'user',
+            ['id'],
+            unique=False,
+            postgresql_where=sa.text('NOT is_active'),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_inactive_id', table_name='user', postgresql_concurrently=True)
+        op.drop_index('ix_user_superuser_id', table_name='user', postgresql_concurrently=True)
+        op.drop_index('ix_user_full_name_trgm', table_name='user', postgresql_concurrently=True)
+        op.drop_index('ix_user_email_trgm', table_name='user', postgresql_concurrently=True)
+        op.drop_index('ix_user_email_pattern', table_name='user', postgresql_concurrently=True)
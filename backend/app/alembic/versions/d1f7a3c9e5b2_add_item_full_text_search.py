@@ -0,0 +1,64 @@
+"""Add item full text search
+
+Revision ID: d1f7a3c9e5b2
+Revises: b5d8e2f4a6c1
+Create Date: 2026-10-18 13:02:37.118420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1f7a3c9e5b2'
+down_revision = 'b5d8e2f4a6c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # A stored generated column, adding it rewrites the table
+    op.add_column(
+        'item',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B')",
+                persisted=True,
+            ),
+            nullable=True,
+        ),
+    )
+    # CONCURRENTLY doesn't lock out writes to item while the indexes are built,
+    # it can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_item_search_vector',
+            'item',
+            ['search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_item_title_trgm',
+            'item',
+            ['title'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'title': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+        )
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_item_title_trgm', table_name='item', postgresql_concurrently=True)
+        op.drop_index(
+            'ix_item_search_vector', table_name='item', postgresql_concurrently=True
+        )
+    op.drop_column('item', 'search_vector')
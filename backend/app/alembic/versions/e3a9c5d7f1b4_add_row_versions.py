@@ -0,0 +1,30 @@
+"""Add user and item row versions, and the items version of users
+
+Revision ID: e3a9c5d7f1b4
+Revises: d1f7a3c9e5b2
+Create Date: 2026-10-18 15:21:09.640213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a9c5d7f1b4'
+down_revision = 'd1f7a3c9e5b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Constant defaults, no table rewrite
+    op.add_column('user', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('user', sa.Column('items_version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('item', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('item', 'version')
+    op.drop_column('user', 'items_version')
+    op.drop_column('user', 'version')
@@ -0,0 +1,146 @@
+"""Add item change tracking and tombstones
+
+Revision ID: f5b1d3e7a9c2
+Revises: e3a9c5d7f1b4
+Create Date: 2026-10-18 17:44:52.301877
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5b1d3e7a9c2'
+down_revision = 'e3a9c5d7f1b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE SEQUENCE item_change_seq')
+    # The volatile defaults rewrite the table, existing items get distinct
+    # sequence numbers
+    op.add_column(
+        'item',
+        sa.Column(
+            'change_xid',
+            sa.BigInteger(),
+            server_default=sa.text('(pg_current_xact_id()::text)::bigint'),
+            nullable=False,
+        ),
+    )
+    op.add_column(
+        'item',
+        sa.Column(
+            'change_seq',
+            sa.BigInteger(),
+            server_default=sa.text("nextval('item_change_seq')"),
+            nullable=False,
+        ),
+    )
+    op.add_column(
+        'item',
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+    op.add_column(
+        'item',
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+
+    op.create_table(
+        'item_tombstone',
+        sa.Column('id', sa.Uuid(), nullable=False),
+        sa.Column('owner_id', sa.Uuid(), nullable=False),
+        sa.Column('change_xid', sa.BigInteger(), nullable=False),
+        sa.Column('change_seq', sa.BigInteger(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_item_tombstone_owner_id_change',
+        'item_tombstone',
+        ['owner_id', 'change_xid', 'change_seq'],
+        unique=False,
+    )
+    op.create_index('ix_item_tombstone_change', 'item_tombstone', ['change_xid', 'change_seq'], unique=False)
+
+    op.execute(
+        """
+        CREATE FUNCTION item_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.updated_at := now();
+            NEW.change_xid := pg_current_xact_id()::text::bigint;
+            NEW.change_seq := nextval('item_change_seq');
+            RETURN NEW;
+        END
+        $$
+        """
+    )
+    op.execute(
+        'CREATE TRIGGER item_changed BEFORE UPDATE ON item '
+        'FOR EACH ROW EXECUTE FUNCTION item_changed()'
+    )
+    # Items deleted along with their owner leave no tombstone, the owner's
+    # tombstones are deleted with it too
+    op.execute(
+        """
+        CREATE FUNCTION item_deleted() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO item_tombstone (id, owner_id, change_xid, change_seq)
+            SELECT
+                deleted_item.id,
+                deleted_item.owner_id,
+                pg_current_xact_id()::text::bigint,
+                nextval('item_change_seq')
+            FROM deleted_item
+            WHERE EXISTS (SELECT FROM "user" WHERE "user".id = deleted_item.owner_id);
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    op.execute(
+        'CREATE TRIGGER item_deleted AFTER DELETE ON item '
+        'REFERENCING OLD TABLE AS deleted_item '
+        'FOR EACH STATEMENT EXECUTE FUNCTION item_deleted()'
+    )
+
+    # CONCURRENTLY doesn't lock out writes to item while the indexes are built,
+    # it can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_item_owner_id_change',
+            'item',
+            ['owner_id', 'change_xid', 'change_seq'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_item_change',
+            'item',
+            ['change_xid', 'change_seq'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_item_change', table_name='item', postgresql_concurrently=True)
+        op.drop_index(
+            'ix_item_owner_id_change', table_name='item', postgresql_concurrently=True
+        )
+    op.execute('DROP TRIGGER item_deleted ON item')
+    op.execute('DROP FUNCTION item_deleted()')
+    op.execute('DROP TRIGGER item_changed ON item')
+    op.execute('DROP FUNCTION item_changed()')
+    op.drop_index('ix_item_tombstone_change', table_name='item_tombstone')
+    op.drop_index('ix_item_tombstone_owner_id_change', table_name='item_tombstone')
+    op.drop_table('item_tombstone')
+    op.drop_column('item', 'updated_at')
+    op.drop_column('item', 'created_at')
+    op.drop_column('item', 'change_seq')
+    op.drop_column('item', 'change_xid')
+    op.execute('DROP SEQUENCE item_change_seq')
@@ -1,44 +1,143 @@
-from collections.abc import Generator
-from typing import Annotated
+import math
+import uuid
+from collections.abc import AsyncGenerator
+from dataclasses import dataclass
+from typing import Annotated, Any
 
-import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
-from pydantic import ValidationError
-from sqlmodel import Session
+from pydantic import BeforeValidator, ValidationError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core import security
+from app.core.cache import principal_cache, token_version_cache
 from app.core.config import settings
-from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.db import async_engine, get_read_engine, replica_engines
+from app.core.pagination import InvalidCursorError, decode_cursor
+from app.core.ratelimit import (
+    account_rate_limiter,
+    client_ip,
+    ip_rate_limiter,
+    trusted_proxies,
+)
+from app.models import ItemField, User, UserField
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
 )
 
 
-def get_db() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    # Objects are not expired on commit, with asyncio they can't be lazy loaded,
+    # and written objects are returned as is, without a SELECT to refresh them
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+SessionDep = Annotated[AsyncSession, Depends(get_db)]
+
+# Set on the responses to successful writes, while it's present the client
+# reads from the primary so it sees its own writes despite replication lag.
+# The frontend is on another origin, it sends its requests with credentials
+# for the cookie to come back
+READ_YOUR_WRITES_COOKIE = "read_your_writes"
+
+
+def get_request_read_engine(request: Request) -> AsyncEngine:
+    """
+    Engine for read only endpoints, a replica when there are any.
+    """
+    if not replica_engines or READ_YOUR_WRITES_COOKIE in request.cookies:
+        return async_engine
+    return get_read_engine()
+
+
+ReadEngineDep = Annotated[AsyncEngine, Depends(get_request_read_engine)]
+
+
+async def get_read_db(db_engine: ReadEngineDep) -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(db_engine, expire_on_commit=False) as session:
         yield session
 
 
-SessionDep = Annotated[Session, Depends(get_db)]
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+@dataclass(frozen=True)
+class Principal:
+    """
+    Identity and permissions of the caller, taken from the access token claims.
+    """
+
+    id: uuid.UUID
+    is_superuser: bool
+
+
+async def _get_token_version(session: AsyncSession, user_id: str) -> int | None:
+    token_version = token_version_cache.get(user_id)
+    if token_version is None:
+        result = await session.exec(
+            select(User.token_version).where(User.id == uuid.UUID(user_id))
+        )
+        token_version = result.first()
+        if token_version is not None:
+            token_version_cache.set(user_id, token_version)
+    return token_version
+
+
+async def get_current_principal(session: SessionDep, token: TokenDep) -> Principal:
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+        token_data = security.decode_access_token(token)
+        user_id = uuid.UUID(token_data.sub)
+    except (InvalidTokenError, ValidationError, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+    if token_data.token_version is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
         )
-        token_data = TokenPayload(**payload)
-    except (InvalidTokenError, ValidationError):
+    # Deactivation, privilege changes and password changes bump the version,
+    # so matching it means the claims in the token are still current
+    token_version = await _get_token_version(session, str(user_id))
+    if token_version is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if token_version != token_data.token_version:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+    if not token_data.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return Principal(id=user_id, is_superuser=token_data.is_superuser)
+
+
+CurrentPrincipal = Annotated[Principal, Depends(get_current_principal)]
+
+
+async def _get_user(
+    session: AsyncSession, user_id: uuid.UUID, *, fill_cache: bool = True
+) -> User | None:
+    cached = principal_cache.get(str(user_id))
+    if cached is not None:
+        # Attach a copy of the cached user to this session without a SELECT
+        return await session.merge(cached, load=False)
+    user = await session.get(User, user_id)
+    if user and fill_cache:
+        detached = User(**user.model_dump())
+        make_transient_to_detached(detached)
+        principal_cache.set(str(user_id), detached)
+    return user
+
+
+def _check_user(user: User | None) -> User:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -46,12 +145,109 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
     return user
 
 
+async def get_current_user(session: SessionDep, principal: CurrentPrincipal) -> User:
+    return _check_user(await _get_user(session, principal.id))
+
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
-    if not current_user.is_superuser:
+async def get_read_current_user(
+    session: ReadSessionDep, db_engine: ReadEngineDep, principal: CurrentPrincipal
+) -> User:
+    """
+    The current user for read only endpoints, from a replica on cache misses.
+    """
+    # A lagging replica could put back a user a write just invalidated
+    fill_cache = db_engine is async_engine
+    return _check_user(await _get_user(session, principal.id, fill_cache=fill_cache))
+
+
+ReadCurrentUser = Annotated[User, Depends(get_read_current_user)]
+
+
+def get_cursor_id(cursor: str | None = None) -> uuid.UUID | None:
+    """
+    Id of the last row of the previous page, for keyset pagination by id.
+    """
+    if cursor is None:
+        return None
+    try:
+        (last_id,) = decode_cursor(cursor, 1)
+        return uuid.UUID(last_id)
+    except (InvalidCursorError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+CursorIdDep = Annotated[uuid.UUID | None, Depends(get_cursor_id)]
+
+
+def _split_fields(value: Any) -> Any:
+    # Both ?fields=id,title and ?fields=id&fields=title
+    if isinstance(value, list):
+        return [name.strip() for names in value for name in str(names).split(",")]
+    return value
+
+
+_FIELDS_DESCRIPTION = "Comma separated fields to return, all of them by default"
+ItemFieldsQuery = Annotated[
+    list[ItemField] | None,
+    BeforeValidator(_split_fields),
+    Query(description=_FIELDS_DESCRIPTION),
+]
+UserFieldsQuery = Annotated[
+    list[UserField] | None,
+    BeforeValidator(_split_fields),
+    Query(description=_FIELDS_DESCRIPTION),
+]
+
+
+def get_current_active_superuser(principal: CurrentPrincipal) -> Principal:
+    if not principal.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
         )
-    return current_user
+    return principal
+
+
+def _retry_later(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many requests, try again later",
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+
+def check_auth_rate_limit(
+    request: Request,
+    *,
+    scope: str,
+    account: str | None = None,
+    charge_account: bool = False,
+) -> None:
+    """
+    Reject the request with a 429 when the client IP or the account exceeded
+    its limit, call it before hashing passwords or sending emails.
+
+    The request counts against the IP limit. The account limit is charged by
+    charge_failed_login, or by every request with `charge_account` (e.g. the
+    emails sent to an address, whichever IPs ask for them).
+    """
+    peer = request.client.host if request.client else "unknown"
+    ip = client_ip(peer, request.headers.getlist("x-forwarded-for"), trusted_proxies)
+    retry_after = ip_rate_limiter.hit(f"{scope}:{ip}")
+    if not retry_after and account:
+        account_key = f"{scope}:{account.lower()}"
+        if charge_account:
+            retry_after = account_rate_limiter.hit(account_key)
+        else:
+            retry_after = account_rate_limiter.check(account_key)
+    if retry_after:
+        raise _retry_later(retry_after)
+
+
+def charge_failed_login(*, scope: str, account: str) -> None:
+    """
+    Count a wrong password against the account limit.
+    """
+    account_rate_limiter.hit(f"{scope}:{account.lower()}")
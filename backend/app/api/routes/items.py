@@ -1,85 +1,454 @@
+import csv
+import io
+import json
 import uuid
-from typing import Any
+from collections.abc import AsyncGenerator, Sequence
+from typing import Annotated, Any, Literal, get_args
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select
+from fastapi import APIRouter, Body, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
+from app import crud, imports
+from app.api.deps import (
+    CurrentPrincipal,
+    CursorIdDep,
+    ItemFieldsQuery,
+    ReadEngineDep,
+    ReadSessionDep,
+    SessionDep,
+)
+from app.core.config import settings
+from app.core.etag import etag_matches, make_etag, not_modified
+from app.core.jobs import jobs, start_job
+from app.core.pagination import (
+    CountStrategy,
+    InvalidCursorError,
+    decode_cursor,
+    encode_cursor,
+    paginate,
+)
+from app.imports import ImportFormat
+from app.models import (
+    Item,
+    ItemChangesPublic,
+    ItemCreate,
+    ItemIdsPublic,
+    ItemPublic,
+    ItemsBulkUpdate,
+    ItemsCount,
+    ItemsFilter,
+    ItemsPublic,
+    ItemUpdate,
+    JobPublic,
+    Message,
+    User,
+)
 
 router = APIRouter(prefix="/items", tags=["items"])
 
+# Rows fetched from the server side cursor and sent at a time by /items/export
+EXPORT_BATCH_SIZE = 1000
+
+
+def _check_bulk_ids(items_filter: ItemsFilter) -> None:
+    if items_filter.ids and len(items_filter.ids) > settings.ITEMS_BULK_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.ITEMS_BULK_MAX_SIZE} ids are allowed",
+        )
+
 
 @router.get("/", response_model=ItemsPublic)
-def read_items(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+async def read_items(
+    request: Request,
+    response: Response,
+    session: ReadSessionDep,
+    current_user: CurrentPrincipal,
+    cursor_id: CursorIdDep,
+    skip: int = 0,
+    limit: int = 100,
+    count: CountStrategy = "exact",
+    fields: ItemFieldsQuery = None,
 ) -> Any:
     """
     Retrieve items.
+
+    Pass the `next_cursor` of a page as `cursor` to get the next one, `skip` is
+    ignored when there's a cursor. Pages after a cursor aren't counted again.
+    `count` can be "estimated" (superusers only, the others get an exact count)
+    or "none" to skip counting. With `fields`, the items only have those fields.
+
+    The ETag of the pages of a user changes whenever any of their items does,
+    pages of all the items (superusers) have none.
+    """
+    where = []
+    if not current_user.is_superuser:
+        where.append(col(Item.owner_id) == current_user.id)
+        statement = select(User.items_version).where(col(User.id) == current_user.id)
+        items_version = (await session.exec(statement)).first()
+        if items_version is not None:
+            etag = make_etag("items", current_user.id, items_version)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            response.headers["ETag"] = etag
+    page = await paginate(
+        session,
+        Item,
+        where=where,
+        cursor_id=cursor_id,
+        skip=skip,
+        limit=limit,
+        count=count,
+        fields=fields,
+    )
+    if fields is not None:
+        # Selected columns, serialized as is without going through ItemPublic
+        return Response(
+            page.to_json(), media_type="application/json", headers=response.headers
+        )
+    return ItemsPublic(
+        data=page.data,
+        count=page.count,
+        has_more=page.has_more,
+        next_cursor=page.next_cursor,
+    )
+
+
+def _decode_search_cursor(
+    cursor: str,
+) -> tuple[crud.ItemSearchMode, float, uuid.UUID]:
+    try:
+        mode, rank, last_id = decode_cursor(cursor, 3)
+        if mode not in get_args(crud.ItemSearchMode):
+            raise ValueError(mode)
+        return mode, float(rank), uuid.UUID(last_id)
+    except (InvalidCursorError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/search", response_model=ItemsPublic)
+async def search_items(
+    session: ReadSessionDep,
+    current_user: CurrentPrincipal,
+    q: Annotated[str, Query(min_length=1, max_length=255)],
+    cursor: str | None = None,
+    limit: int = 100,
+) -> Any:
     """
+    Search items, best matches first.
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Item)
-        count = session.exec(count_statement).one()
-        statement = select(Item).offset(skip).limit(limit)
-        items = session.exec(statement).all()
+    Matches the words of `q` in the title and description, `q` supports
+    quoted phrases, "or" and "-" to exclude a word. When nothing matches, the
+    items with a title similar to `q` are returned instead, to find prefixes
+    and misspelled words. Pass the `next_cursor` of a page as `cursor` to get
+    the next one. There's no count.
+    """
+    owner_id = None if current_user.is_superuser else current_user.id
+    if cursor is None:
+        after = None
+        mode: crud.ItemSearchMode = "fulltext"
     else:
-        count_statement = (
-            select(func.count())
-            .select_from(Item)
-            .where(Item.owner_id == current_user.id)
+        mode, rank, last_id = _decode_search_cursor(cursor)
+        after = (rank, last_id)
+    # One extra row tells whether there's a next page
+    results = await crud.search_items_async(
+        session=session,
+        query=q,
+        mode=mode,
+        owner_id=owner_id,
+        after=after,
+        limit=limit + 1,
+    )
+    if not results and cursor is None:
+        mode = "trigram"
+        results = await crud.search_items_async(
+            session=session, query=q, mode=mode, owner_id=owner_id, limit=limit + 1
         )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Item)
-            .where(Item.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
+    has_more = len(results) > limit
+    results = results[:limit]
+    next_cursor = None
+    if has_more and results:
+        last_item, last_rank = results[-1]
+        next_cursor = encode_cursor(mode, last_rank, last_item.id)
+    return ItemsPublic(
+        data=[item for item, _ in results],
+        count=None,
+        has_more=has_more,
+        next_cursor=next_cursor,
+    )
+
+
+def _decode_changes_cursor(cursor: str) -> tuple[int, int]:
+    try:
+        xid, seq = decode_cursor(cursor, 2)
+        if not isinstance(xid, int) or not isinstance(seq, int):
+            raise TypeError(cursor)
+        return xid, seq
+    except (InvalidCursorError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/changes", response_model=ItemChangesPublic)
+async def read_item_changes(
+    session: ReadSessionDep,
+    current_user: CurrentPrincipal,
+    since: str | None = None,
+    limit: int = 100,
+) -> Any:
+    """
+    Get the items created, updated or deleted since the last sync.
+
+    Sync without `since` first to get all the items, and pass the
+    `next_cursor` of each response as `since` to the next sync. Get the next
+    changes right away while `has_more` is true. Changes show up once the
+    transactions running when they were made have finished.
+    """
+    after = (0, 0) if since is None else _decode_changes_cursor(since)
+    # One extra change tells whether there are more
+    changes = await crud.read_item_changes_async(
+        session=session,
+        owner_id=None if current_user.is_superuser else current_user.id,
+        after=after,
+        limit=limit + 1,
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        after = changes[-1][:2]
+    return ItemChangesPublic(
+        data=[item for _, _, item in changes if isinstance(item, Item)],
+        deleted=[item for _, _, item in changes if isinstance(item, uuid.UUID)],
+        has_more=has_more,
+        next_cursor=encode_cursor(*after),
+    )
+
+
+@router.post("/bulk", response_model=ItemIdsPublic)
+async def create_items(
+    *,
+    session: SessionDep,
+    current_user: CurrentPrincipal,
+    items_in: Annotated[
+        list[ItemCreate], Body(min_length=1, max_length=settings.ITEMS_BULK_MAX_SIZE)
+    ],
+) -> Any:
+    """
+    Create many items at once, in a single transaction.
+    """
+    ids = await crud.create_items_async(
+        session=session, items_in=items_in, owner_id=current_user.id
+    )
+    return ItemIdsPublic(data=ids, count=len(ids))
+
+
+@router.patch("/bulk", response_model=ItemsCount)
+async def update_items(
+    *, session: SessionDep, current_user: CurrentPrincipal, body: ItemsBulkUpdate
+) -> Any:
+    """
+    Update all the items matching a filter, at most ITEMS_BULK_MAX_SIZE ids.
+    """
+    _check_bulk_ids(body.filter)
+    if not body.update.model_fields_set:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    count = await crud.update_items_async(
+        session=session,
+        items_filter=body.filter,
+        item_in=body.update,
+        owner_id=None if current_user.is_superuser else current_user.id,
+    )
+    return ItemsCount(count=count)
+
+
+@router.delete("/bulk", response_model=ItemsCount)
+async def delete_items(
+    *, session: SessionDep, current_user: CurrentPrincipal, items_filter: ItemsFilter
+) -> Any:
+    """
+    Delete all the items matching a filter, at most ITEMS_BULK_MAX_SIZE ids.
+    """
+    _check_bulk_ids(items_filter)
+    count = await crud.delete_items_async(
+        session=session,
+        items_filter=items_filter,
+        owner_id=None if current_user.is_superuser else current_user.id,
+    )
+    return ItemsCount(count=count)
+
+
+def _export_ndjson(rows: Sequence[Row[Any]]) -> str:
+    return "".join(
+        json.dumps(
+            {
+                "id": str(row.id),
+                "title": row.title,
+                "description": row.description,
+                "owner_id": str(row.owner_id),
+            }
         )
-        items = session.exec(statement).all()
+        + "\n"
+        for row in rows
+    )
+
+
+def _export_csv(rows: Sequence[Row[Any]]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
 
-    return ItemsPublic(data=items, count=count)
+async def _export_items(
+    db_engine: AsyncEngine,
+    owner_id: uuid.UUID | None,
+    format: Literal["ndjson", "csv"],
+) -> AsyncGenerator[str, None]:
+    statement = (
+        select(col(Item.id), col(Item.title), col(Item.description), col(Item.owner_id))
+        .order_by(col(Item.id))
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    if owner_id is not None:
+        statement = statement.where(col(Item.owner_id) == owner_id)
+    formatter = _export_csv if format == "csv" else _export_ndjson
+    if format == "csv":
+        yield "id,title,description,owner_id\r\n"
+    # The session of the request dependencies is closed before the response
+    # body is sent, the generator uses its own
+    async with AsyncSession(db_engine) as session:
+        result = await session.stream(statement)
+        async for rows in result.partitions():
+            yield formatter(rows)
+
+
+@router.get("/export")
+async def export_items(
+    db_engine: ReadEngineDep,
+    current_user: CurrentPrincipal,
+    format: Literal["ndjson", "csv"] = "ndjson",
+) -> StreamingResponse:
+    """
+    Download all the items as NDJSON or CSV.
+
+    Superusers get the items of every user. The rows are read with a server
+    side cursor and sent as they come, in batches.
+    """
+    owner_id = None if current_user.is_superuser else current_user.id
+    return StreamingResponse(
+        _export_items(db_engine, owner_id, format),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="items.{format}"'},
+    )
+
+
+@router.post(
+    "/import",
+    response_model=JobPublic,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/x-ndjson": {"schema": {"type": "string"}},
+                "text/csv": {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def import_items(
+    request: Request,
+    session: SessionDep,
+    current_user: CurrentPrincipal,
+    format: ImportFormat = "ndjson",
+) -> Any:
+    """
+    Import items from an NDJSON or CSV body, CSV needs a header with a title
+    and optionally a description column.
+
+    The body is processed as it's received, so it can be larger than memory.
+    The valid rows are committed in batches, the invalid ones are reported in
+    the errors. The response is only sent once the whole body is processed,
+    with the final progress of the job. Jobs are kept in memory by the worker
+    process that ran them, `GET /items/import/{job_id}` may not find them.
+    """
+    job = start_job(current_user.id, read=0, rejected=0, imported=0)
+    try:
+        await imports.import_items(
+            session=session,
+            owner_id=current_user.id,
+            chunks=request.stream(),
+            format=format,
+            job=job,
+        )
+    except Exception:
+        job.status = "failed"
+        raise
+    job.status = "succeeded"
+    return job
+
+
+@router.get("/import/{job_id}", response_model=JobPublic)
+async def read_import_job(current_user: CurrentPrincipal, job_id: uuid.UUID) -> Any:
+    """
+    Get the result of an import, the job is only known by the worker process
+    that ran it.
+    """
+    job = jobs.get(job_id)
+    if not job or (not current_user.is_superuser and job.owner_id != current_user.id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @router.get("/{id}", response_model=ItemPublic)
-def read_item(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
+async def read_item(
+    request: Request,
+    response: Response,
+    session: ReadSessionDep,
+    current_user: CurrentPrincipal,
+    id: uuid.UUID,
+) -> Any:
     """
     Get item by ID.
     """
-    item = session.get(Item, id)
+    item = await session.get(Item, id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     if not current_user.is_superuser and (item.owner_id != current_user.id):
         raise HTTPException(status_code=400, detail="Not enough permissions")
+    etag = make_etag(item.id, item.version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return item
 
 
 @router.post("/", response_model=ItemPublic)
-def create_item(
-    *, session: SessionDep, current_user: CurrentUser, item_in: ItemCreate
+async def create_item(
+    *, session: SessionDep, current_user: CurrentPrincipal, item_in: ItemCreate
 ) -> Any:
     """
     Create new item.
     """
     item = Item.model_validate(item_in, update={"owner_id": current_user.id})
     session.add(item)
-    session.commit()
-    session.refresh(item)
+    await session.commit()
     return item
 
 
 @router.put("/{id}", response_model=ItemPublic)
-def update_item(
+async def update_item(
     *,
     session: SessionDep,
-    current_user: CurrentUser,
+    current_user: CurrentPrincipal,
     id: uuid.UUID,
     item_in: ItemUpdate,
 ) -> Any:
     """
     Update an item.
     """
-    item = session.get(Item, id)
+    item = await session.get(Item, id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     if not current_user.is_superuser and (item.owner_id != current_user.id):
@@ -87,23 +456,22 @@ def update_item(
     update_dict = item_in.model_dump(exclude_unset=True)
     item.sqlmodel_update(update_dict)
     session.add(item)
-    session.commit()
-    session.refresh(item)
+    await session.commit()
     return item
 
 
 @router.delete("/{id}")
-def delete_item(
-    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+async def delete_item(
+    session: SessionDep, current_user: CurrentPrincipal, id: uuid.UUID
 ) -> Message:
     """
     Delete an item.
     """
-    item = session.get(Item, id)
+    item = await session.get(Item, id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     if not current_user.is_superuser and (item.owner_id != current_user.id):
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    session.delete(item)
-    session.commit()
+    await session.delete(item)
+    await session.commit()
     return Message(message="Item deleted successfully")
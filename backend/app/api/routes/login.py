@@ -1,16 +1,31 @@
 from datetime import timedelta
 from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app import crud
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
+from app.api.deps import (
+    CurrentUser,
+    SessionDep,
+    charge_failed_login,
+    check_auth_rate_limit,
+    get_current_active_superuser,
+)
 from app.core import security
+from app.core.cache import invalidate_principal
 from app.core.config import settings
-from app.core.security import get_password_hash
-from app.models import Message, NewPassword, Token, UserPublic
+from app.core.security import get_password_hash_async
+from app.models import (
+    Message,
+    NewPassword,
+    RefreshTokenRequest,
+    Token,
+    User,
+    UserPublic,
+)
 from app.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
@@ -21,30 +36,56 @@ from app.utils import (
 router = APIRouter(tags=["login"])
 
 
+def _create_access_token(user: User) -> str:
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    return security.create_access_token(
+        user.id,
+        expires_delta=access_token_expires,
+        is_superuser=user.is_superuser,
+        is_active=user.is_active,
+        token_version=user.token_version,
+    )
+
+
 @router.post("/login/access-token")
-def login_access_token(
-    session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+async def login_access_token(
+    request: Request,
+    session: SessionDep,
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.authenticate(
+    check_auth_rate_limit(request, scope="login", account=form_data.username)
+    user = await crud.authenticate_async(
         session=session, email=form_data.username, password=form_data.password
     )
     if not user:
+        charge_failed_login(scope="login", account=form_data.username)
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    return Token(
-        access_token=security.create_access_token(
-            user.id, expires_delta=access_token_expires
-        )
+    access_token = _create_access_token(user)
+    refresh_token = await crud.create_refresh_token_async(session=session, user=user)
+    return Token(access_token=access_token, refresh_token=refresh_token)
+
+
+@router.post("/login/refresh-token")
+async def login_refresh_token(session: SessionDep, body: RefreshTokenRequest) -> Token:
+    """
+    Exchange a refresh token for a new access token and a new refresh token
+    """
+    rotated = await crud.rotate_refresh_token_async(
+        session=session, token=body.refresh_token
     )
+    if not rotated:
+        raise HTTPException(status_code=400, detail="Invalid refresh token")
+    user, refresh_token = rotated
+    return Token(access_token=_create_access_token(user), refresh_token=refresh_token)
 
 
 @router.post("/login/test-token", response_model=UserPublic)
-def test_token(current_user: CurrentUser) -> Any:
+async def test_token(current_user: CurrentUser) -> Any:
     """
     Test access token
     """
@@ -52,11 +93,17 @@ def test_token(current_user: CurrentUser) -> Any:
 
 
 @router.post("/password-recovery/{email}")
-def recover_password(email: str, session: SessionDep) -> Message:
+async def recover_password(
+    email: str, request: Request, session: SessionDep
+) -> Message:
     """
     Password Recovery
     """
-    user = crud.get_user_by_email(session=session, email=email)
+    # Limited per address too, the scope keeps it apart from the login limit
+    check_auth_rate_limit(
+        request, scope="password-recovery", account=email, charge_account=True
+    )
+    user = await crud.get_user_by_email_async(session=session, email=email)
 
     if not user:
         raise HTTPException(
@@ -67,7 +114,8 @@ def recover_password(email: str, session: SessionDep) -> Message:
     email_data = generate_reset_password_email(
         email_to=user.email, email=email, token=password_reset_token
     )
-    send_email(
+    await run_in_threadpool(
+        send_email,
         email_to=user.email,
         subject=email_data.subject,
         html_content=email_data.html_content,
@@ -76,14 +124,14 @@ def recover_password(email: str, session: SessionDep) -> Message:
 
 
 @router.post("/reset-password/")
-def reset_password(session: SessionDep, body: NewPassword) -> Message:
+async def reset_password(session: SessionDep, body: NewPassword) -> Message:
     """
     Reset password
     """
     email = verify_password_reset_token(token=body.token)
     if not email:
         raise HTTPException(status_code=400, detail="Invalid token")
-    user = crud.get_user_by_email(session=session, email=email)
+    user = await crud.get_user_by_email_async(session=session, email=email)
     if not user:
         raise HTTPException(
             status_code=404,
@@ -91,10 +139,12 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
         )
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    hashed_password = get_password_hash(password=body.new_password)
+    hashed_password = await get_password_hash_async(body.new_password)
     user.hashed_password = hashed_password
+    user.token_version += 1
     session.add(user)
-    session.commit()
+    await session.commit()
+    invalidate_principal(user.id)
     return Message(message="Password updated successfully")
 
 
@@ -103,11 +153,11 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
     dependencies=[Depends(get_current_active_superuser)],
     response_class=HTMLResponse,
 )
-def recover_password_html_content(email: str, session: SessionDep) -> Any:
+async def recover_password_html_content(email: str, session: SessionDep) -> Any:
     """
     HTML Content for Password Recovery
     """
-    user = crud.get_user_by_email(session=session, email=email)
+    user = await crud.get_user_by_email_async(session=session, email=email)
 
     if not user:
         raise HTTPException(
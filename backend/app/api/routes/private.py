@@ -4,7 +4,7 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 
 from app.api.deps import SessionDep
-from app.core.security import get_password_hash
+from app.core.security import get_password_hash_async
 from app.models import (
     User,
     UserPublic,
@@ -21,18 +21,19 @@ class PrivateUserCreate(BaseModel):
 
 
 @router.post("/users/", response_model=UserPublic)
-def create_user(user_in: PrivateUserCreate, session: SessionDep) -> Any:
+async def create_user(user_in: PrivateUserCreate, session: SessionDep) -> Any:
     """
     Create a new user.
     """
 
+    # The table model isn't validated, lower case the email as LowerCaseEmailStr
     user = User(
-        email=user_in.email,
+        email=user_in.email.lower(),
         full_name=user_in.full_name,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await get_password_hash_async(user_in.password),
     )
 
     session.add(user)
-    session.commit()
+    await session.commit()
 
     return user
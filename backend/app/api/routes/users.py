@@ -1,19 +1,40 @@
 import uuid
-from typing import Any
+from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import col, delete, func, select
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import col
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import crud
 from app.api.deps import (
+    CurrentPrincipal,
     CurrentUser,
+    CursorIdDep,
+    ReadCurrentUser,
+    ReadSessionDep,
     SessionDep,
+    UserFieldsQuery,
+    check_auth_rate_limit,
     get_current_active_superuser,
 )
+from app.core.cache import invalidate_principal
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.db import async_engine
+from app.core.etag import etag_matches, make_etag, not_modified
+from app.core.jobs import Job, jobs, start_job
+from app.core.pagination import CountStrategy, paginate
+from app.core.security import get_password_hash_async, verify_password_async
 from app.models import (
-    Item,
+    JobPublic,
     Message,
     UpdatePassword,
     User,
@@ -28,46 +49,88 @@ from app.utils import generate_new_account_email, send_email
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+TextFilterQuery = Annotated[str | None, Query(min_length=1, max_length=255)]
+
 
 @router.get(
     "/",
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_users(
+    session: ReadSessionDep,
+    cursor_id: CursorIdDep,
+    skip: int = 0,
+    limit: int = 100,
+    count: CountStrategy = "exact",
+    fields: UserFieldsQuery = None,
+    email_prefix: TextFilterQuery = None,
+    email_contains: TextFilterQuery = None,
+    full_name_contains: TextFilterQuery = None,
+    is_active: bool | None = None,
+    is_superuser: bool | None = None,
+) -> Any:
     """
     Retrieve users.
-    """
-
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
 
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    Pass the `next_cursor` of a page as `cursor` to get the next one, `skip` is
+    ignored when there's a cursor. Pages after a cursor aren't counted again.
+    `count` can be "estimated" or "none" to skip counting. With `fields`, the
+    users only have those fields.
 
-    return UsersPublic(data=users, count=count)
+    The users can be filtered by the start of their email, by a part of their
+    email or full name (case insensitive, at least 3 characters to be fast),
+    and by status. With filters, "estimated" counts are exact.
+    """
+    where = crud.users_filter(
+        email_prefix=email_prefix,
+        email_contains=email_contains,
+        full_name_contains=full_name_contains,
+        is_active=is_active,
+        is_superuser=is_superuser,
+    )
+    page = await paginate(
+        session,
+        User,
+        where=where,
+        cursor_id=cursor_id,
+        skip=skip,
+        limit=limit,
+        count=count,
+        fields=fields,
+    )
+    if fields is not None:
+        # Selected columns, serialized as is without going through UserPublic
+        return Response(page.to_json(), media_type="application/json")
+    return UsersPublic(
+        data=page.data,
+        count=page.count,
+        has_more=page.has_more,
+        next_cursor=page.next_cursor,
+    )
 
 
 @router.post(
     "/", dependencies=[Depends(get_current_active_superuser)], response_model=UserPublic
 )
-def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
+async def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
     """
     Create new user.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
+    user = await crud.get_user_by_email_async(session=session, email=user_in.email)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system.",
         )
 
-    user = crud.create_user(session=session, user_create=user_in)
+    user = await crud.create_user_async(session=session, user_create=user_in)
     if settings.emails_enabled and user_in.email:
         email_data = generate_new_account_email(
             email_to=user_in.email, username=user_in.email, password=user_in.password
         )
-        send_email(
+        await run_in_threadpool(
+            send_email,
             email_to=user_in.email,
             subject=email_data.subject,
             html_content=email_data.html_content,
@@ -76,7 +139,7 @@ def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
 
 
 @router.patch("/me", response_model=UserPublic)
-def update_user_me(
+async def update_user_me(
     *, session: SessionDep, user_in: UserUpdateMe, current_user: CurrentUser
 ) -> Any:
     """
@@ -84,7 +147,9 @@ def update_user_me(
     """
 
     if user_in.email:
-        existing_user = crud.get_user_by_email(session=session, email=user_in.email)
+        existing_user = await crud.get_user_by_email_async(
+            session=session, email=user_in.email
+        )
         if existing_user and existing_user.id != current_user.id:
             raise HTTPException(
                 status_code=409, detail="User with this email already exists"
@@ -92,84 +157,136 @@ def update_user_me(
     user_data = user_in.model_dump(exclude_unset=True)
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
+    await session.commit()
+    invalidate_principal(current_user.id)
     return current_user
 
 
 @router.patch("/me/password", response_model=Message)
-def update_password_me(
+async def update_password_me(
     *, session: SessionDep, body: UpdatePassword, current_user: CurrentUser
 ) -> Any:
     """
     Update own password.
     """
-    if not verify_password(body.current_password, current_user.hashed_password):
+    if not await verify_password_async(
+        body.current_password, current_user.hashed_password
+    ):
         raise HTTPException(status_code=400, detail="Incorrect password")
     if body.current_password == body.new_password:
         raise HTTPException(
             status_code=400, detail="New password cannot be the same as the current one"
         )
-    hashed_password = get_password_hash(body.new_password)
+    hashed_password = await get_password_hash_async(body.new_password)
     current_user.hashed_password = hashed_password
+    # Incremented by the database, the cached user can be stale
+    current_user.token_version = col(User.token_version) + 1  # type: ignore[assignment]
     session.add(current_user)
-    session.commit()
+    await session.commit()
+    invalidate_principal(current_user.id)
     return Message(message="Password updated successfully")
 
 
 @router.get("/me", response_model=UserPublic)
-def read_user_me(current_user: CurrentUser) -> Any:
+async def read_user_me(
+    request: Request, response: Response, current_user: ReadCurrentUser
+) -> Any:
     """
     Get current user.
     """
+    etag = make_etag(current_user.id, current_user.version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return current_user
 
 
-@router.delete("/me", response_model=Message)
-def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
+async def _purge_user(user_id: uuid.UUID, job: Job) -> None:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        try:
+            await crud.purge_user_async(
+                session=session,
+                user_id=user_id,
+                batch_size=settings.USER_DELETE_BATCH_SIZE,
+                job=job,
+            )
+        except Exception:
+            job.status = "failed"
+            raise
+    job.status = "succeeded"
+
+
+async def _delete_user(
+    session: AsyncSession,
+    background_tasks: BackgroundTasks,
+    user: User,
+    owner_id: uuid.UUID,
+) -> Job:
+    if not user.deleted_at:
+        await crud.mark_user_deleted_async(session=session, db_user=user)
+    job = start_job(owner_id, items_deleted=0)
+    background_tasks.add_task(_purge_user, user.id, job)
+    return job
+
+
+@router.delete("/me", status_code=202, response_model=JobPublic)
+async def delete_user_me(
+    session: SessionDep, current_user: CurrentUser, background_tasks: BackgroundTasks
+) -> Any:
     """
     Delete own user.
+
+    The user can't log in anymore once this returns, their items are deleted
+    in the background.
     """
     if current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    session.delete(current_user)
-    session.commit()
-    return Message(message="User deleted successfully")
+    return await _delete_user(session, background_tasks, current_user, current_user.id)
 
 
 @router.post("/signup", response_model=UserPublic)
-def register_user(session: SessionDep, user_in: UserRegister) -> Any:
+async def register_user(
+    request: Request, session: SessionDep, user_in: UserRegister
+) -> Any:
     """
     Create new user without the need to be logged in.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
+    check_auth_rate_limit(request, scope="signup")
+    user = await crud.get_user_by_email_async(session=session, email=user_in.email)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system",
         )
     user_create = UserCreate.model_validate(user_in)
-    user = crud.create_user(session=session, user_create=user_create)
+    user = await crud.create_user_async(session=session, user_create=user_create)
     return user
 
 
 @router.get("/{user_id}", response_model=UserPublic)
-def read_user_by_id(
-    user_id: uuid.UUID, session: SessionDep, current_user: CurrentUser
+async def read_user_by_id(
+    user_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    session: ReadSessionDep,
+    current_user: CurrentPrincipal,
 ) -> Any:
     """
     Get a specific user by id.
     """
-    user = session.get(User, user_id)
-    if user == current_user:
-        return user
-    if not current_user.is_superuser:
+    user = await session.get(User, user_id)
+    if not (user and user.id == current_user.id) and not current_user.is_superuser:
         raise HTTPException(
             status_code=403,
             detail="The user doesn't have enough privileges",
         )
+    if user:
+        etag = make_etag(user.id, user.version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
     return user
 
 
@@ -178,7 +295,7 @@ def read_user_by_id(
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UserPublic,
 )
-def update_user(
+async def update_user(
     *,
     session: SessionDep,
     user_id: uuid.UUID,
@@ -188,39 +305,67 @@ def update_user(
     Update a user.
     """
 
-    db_user = session.get(User, user_id)
-    if not db_user:
+    db_user = await session.get(User, user_id)
+    if not db_user or db_user.deleted_at:
         raise HTTPException(
             status_code=404,
             detail="The user with this id does not exist in the system",
         )
     if user_in.email:
-        existing_user = crud.get_user_by_email(session=session, email=user_in.email)
+        existing_user = await crud.get_user_by_email_async(
+            session=session, email=user_in.email
+        )
         if existing_user and existing_user.id != user_id:
             raise HTTPException(
                 status_code=409, detail="User with this email already exists"
             )
 
-    db_user = crud.update_user(session=session, db_user=db_user, user_in=user_in)
+    db_user = await crud.update_user_async(
+        session=session, db_user=db_user, user_in=user_in
+    )
     return db_user
 
 
-@router.delete("/{user_id}", dependencies=[Depends(get_current_active_superuser)])
-def delete_user(
-    session: SessionDep, current_user: CurrentUser, user_id: uuid.UUID
-) -> Message:
+@router.delete(
+    "/{user_id}",
+    dependencies=[Depends(get_current_active_superuser)],
+    status_code=202,
+    response_model=JobPublic,
+)
+async def delete_user(
+    session: SessionDep,
+    current_user: CurrentPrincipal,
+    user_id: uuid.UUID,
+    background_tasks: BackgroundTasks,
+) -> Any:
     """
     Delete a user.
+
+    The user can't log in anymore once this returns, their items are deleted
+    in the background, the progress can be followed with the returned job id.
+    Deleting a user again resumes a deletion that was interrupted.
     """
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if user == current_user:
+    if user.id == current_user.id:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    statement = delete(Item).where(col(Item.owner_id) == user_id)
-    session.exec(statement)  # type: ignore
-    session.delete(user)
-    session.commit()
-    return Message(message="User deleted successfully")
+    return await _delete_user(session, background_tasks, user, current_user.id)
+
+
+@router.get(
+    "/deletions/{job_id}",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=JobPublic,
+)
+async def read_deletion_job(job_id: uuid.UUID) -> Any:
+    """
+    Get the progress of a user deletion, the job is known by the worker process
+    that runs it.
+    """
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -2,6 +2,10 @@ from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
 from app.api.deps import get_current_active_superuser
+from app.core.cache import principal_cache
+from app.core.db import InstrumentedReplicaPool, async_engine, engine, pool_stats
+from app.core.ratelimit import account_rate_limiter, ip_rate_limiter
+from app.core.security import password_hasher, token_cache
 from app.models import Message
 from app.utils import generate_test_email, send_email
 
@@ -29,3 +33,24 @@ def test_email(email_to: EmailStr) -> Message:
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
+
+
+@router.get(
+    "/metrics/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def metrics() -> dict[str, dict[str, float]]:
+    """
+    Internal counters of the worker process that served the request.
+    """
+    return {
+        "db_pool": pool_stats(async_engine.sync_engine),
+        "db_pool_sync": pool_stats(engine),
+        # All the replicas together
+        "db_pool_replicas": InstrumentedReplicaPool.metrics.stats(),
+        "password_hashing": password_hasher.stats(),
+        "principal_cache": principal_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "ip_rate_limit": ip_rate_limiter.stats(),
+        "account_rate_limit": account_rate_limiter.stats(),
+    }
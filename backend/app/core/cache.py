@@ -0,0 +1,133 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import TYPE_CHECKING, Generic, Protocol, TypeVar
+
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    from app.models import User
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Thread safe LRU cache with a time to live for each entry.
+
+    When the cache is full, the least recently used entry is evicted. Expired
+    entries are dropped when they are read or when they reach the LRU end.
+    """
+
+    def __init__(self, *, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: K) -> V | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: K, value: V, *, ttl: float | None = None) -> None:
+        """
+        Store `value`, `ttl` can shorten (never extend) the default time to live.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: K) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class InvalidationBus(Protocol):
+    """
+    Fan out cache invalidations to every worker process.
+
+    A deployment running several workers can plug an implementation backed by
+    a shared channel (e.g. Postgres LISTEN/NOTIFY or Redis pub/sub).
+    """
+
+    def publish(self, channel: str, key: str) -> None: ...
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None: ...
+
+
+class LocalInvalidationBus:
+    """
+    In process stand-in for `InvalidationBus`, delivers messages synchronously.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: dict[str, list[Callable[[str], None]]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, key: str) -> None:
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, []))
+        for callback in callbacks:
+            callback(key)
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+
+invalidation_bus: InvalidationBus = LocalInvalidationBus()
+
+# Detached copies of the authenticated users, keyed by user id, see
+# app.api.deps.get_current_user
+principal_cache: "TTLCache[str, User]" = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_MAX_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+invalidation_bus.subscribe("principal", principal_cache.invalidate)
+
+# Current User.token_version by user id, see app.api.deps.get_current_principal
+token_version_cache: TTLCache[str, int] = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_MAX_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+invalidation_bus.subscribe("principal", token_version_cache.invalidate)
+
+
+def invalidate_principal(user_id: uuid.UUID) -> None:
+    invalidation_bus.publish("principal", str(user_id))
@@ -23,6 +23,18 @@ def parse_cors(v: Any) -> list[str] | str:
     raise ValueError(v)
 
 
+def parse_servers(v: Any) -> list[str]:
+    if isinstance(v, str):
+        v = [i.strip() for i in v.split(",") if i.strip()]
+    if not isinstance(v, list):
+        raise ValueError(v)
+    for server in v:
+        host, colon, port = str(server).partition(":")
+        if not host or (colon and not port.isdigit()):
+            raise ValueError(f"Expected host or host:port, got {server!r}")
+    return v
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         # Use top level .env file (one level above ./backend/)
@@ -32,8 +44,20 @@ class Settings(BaseSettings):
     )
     API_V1_STR: str = "/api/v1"
     SECRET_KEY: str = secrets.token_urlsafe(32)
-    # 60 minutes * 24 hours * 8 days = 8 days
+    # 60 minutes * 24 hours * 8 days = 8 days, the frontend doesn't use the
+    # refresh token yet, lower it once clients get new access tokens with it
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    # 60 minutes * 24 hours * 8 days = 8 days
+    REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    # Expired refresh tokens are deleted periodically, in batches
+    REFRESH_TOKEN_CLEANUP_INTERVAL_SECONDS: int = 60 * 60
+    REFRESH_TOKEN_CLEANUP_BATCH_SIZE: int = 1000
+    # Authenticated users are cached per process, set the TTL to 0 to disable it
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 30
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10_000
+    # Decoded access tokens are cached too, never past their expiration
+    TOKEN_CACHE_TTL_SECONDS: int = 60 * 5
+    TOKEN_CACHE_MAX_SIZE: int = 10_000
     FRONTEND_HOST: str = "http://localhost:5173"
     ENVIRONMENT: Literal["local", "staging", "production"] = "local"
 
@@ -55,6 +79,16 @@ class Settings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str = ""
     POSTGRES_DB: str = ""
+    # Per worker process connection pool, keep
+    # workers * (POSTGRES_POOL_SIZE + POSTGRES_MAX_OVERFLOW) under max_connections
+    POSTGRES_POOL_SIZE: int = 10
+    POSTGRES_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TIMEOUT: float = 30
+    POSTGRES_POOL_RECYCLE: int = 60 * 30
+    POSTGRES_POOL_PRE_PING: bool = True
+    # Number of executions before psycopg prepares a statement server side,
+    # None disables prepared statements (needed behind PgBouncer transaction mode)
+    POSTGRES_PREPARE_THRESHOLD: int | None = 5
 
     @computed_field  # type: ignore[prop-decorator]
     @property
@@ -68,6 +102,32 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Read replicas as host or host:port, with the same user, password and
+    # database as the primary. GET endpoints read from them, except for
+    # clients that wrote something in the last READ_YOUR_WRITES_SECONDS
+    POSTGRES_REPLICA_SERVERS: Annotated[
+        list[str] | str, BeforeValidator(parse_servers)
+    ] = []
+    READ_YOUR_WRITES_SECONDS: int = 5
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def SQLALCHEMY_REPLICA_DATABASE_URIS(self) -> list[PostgresDsn]:
+        uris = []
+        for server in self.POSTGRES_REPLICA_SERVERS:
+            host, _, port = server.partition(":")
+            uris.append(
+                PostgresDsn.build(
+                    scheme="postgresql+psycopg",
+                    username=self.POSTGRES_USER,
+                    password=self.POSTGRES_PASSWORD,
+                    host=host,
+                    port=int(port) if port else self.POSTGRES_PORT,
+                    path=self.POSTGRES_DB,
+                )
+            )
+        return uris
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -85,6 +145,38 @@ class Settings(BaseSettings):
 
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 48
 
+    # Maximum number of items in a POST /items/bulk request, and of ids in a
+    # bulk update or delete
+    ITEMS_BULK_MAX_SIZE: int = 10_000
+
+    # Progress of long running jobs (e.g. item imports) is kept in memory by
+    # the worker process that runs them
+    JOBS_TTL_SECONDS: int = 60 * 60 * 24
+    JOBS_MAX_SIZE: int = 10_000
+    JOBS_MAX_ERRORS: int = 1000
+    # Items of deleted users are deleted by a job, one transaction per batch
+    USER_DELETE_BATCH_SIZE: int = 10_000
+    # Deletions interrupted before the end are resumed at startup and then
+    # periodically, once they're older than the interval
+    USER_PURGE_SWEEP_INTERVAL_SECONDS: int = 60 * 60
+
+    # bcrypt runs in a pool of worker processes, when all the workers are busy
+    # and the queue is full, new logins get a 503 instead of piling up
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 32
+
+    # Token buckets for login, signup and password recovery, per client IP and
+    # per account, set the burst to 0 to disable a limit
+    AUTH_RATE_LIMIT_IP_BURST: int = 20
+    AUTH_RATE_LIMIT_IP_PER_MINUTE: int = 10
+    AUTH_RATE_LIMIT_ACCOUNT_BURST: int = 5
+    AUTH_RATE_LIMIT_ACCOUNT_PER_MINUTE: int = 2
+    AUTH_RATE_LIMIT_MAX_KEYS: int = 100_000
+    # Comma separated addresses or networks of the proxies in front of the
+    # backend (Traefik), the client IP is taken from the X-Forwarded-For they
+    # set. The backend is only reachable through them, on a private network
+    TRUSTED_PROXIES: str = "127.0.0.1,::1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16"
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def emails_enabled(self) -> bool:
@@ -1,10 +1,143 @@
-from sqlmodel import Session, create_engine, select
+import random
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import Engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
+from sqlmodel import Session, create_engine
 
 from app import crud
 from app.core.config import settings
-from app.models import User, UserCreate
+from app.models import UserCreate
+
+
+class PoolMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.checkout_wait_seconds_total = 0.0
+        self.checkout_wait_seconds_max = 0.0
+        self.in_use = 0
+        self.in_use_max = 0
+
+    def record_wait(self, seconds: float, *, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            self.checkout_wait_seconds_total += seconds
+            self.checkout_wait_seconds_max = max(
+                self.checkout_wait_seconds_max, seconds
+            )
+
+    def record_checkout(self) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.in_use_max = max(self.in_use_max, self.in_use)
+
+    def record_checkin(self) -> None:
+        with self._lock:
+            self.in_use -= 1
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "checkout_wait_seconds_total": self.checkout_wait_seconds_total,
+                "checkout_wait_seconds_max": self.checkout_wait_seconds_max,
+                "in_use": self.in_use,
+                "in_use_max": self.in_use_max,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection.
+    """
+
+    metrics = PoolMetrics()
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedAsyncAdaptedQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    metrics = PoolMetrics()
+
+
+class InstrumentedReplicaPool(InstrumentedAsyncAdaptedQueuePool):
+    metrics = PoolMetrics()
+
+
+engine_options: dict[str, Any] = {
+    "pool_size": settings.POSTGRES_POOL_SIZE,
+    "max_overflow": settings.POSTGRES_MAX_OVERFLOW,
+    "pool_timeout": settings.POSTGRES_POOL_TIMEOUT,
+    "pool_recycle": settings.POSTGRES_POOL_RECYCLE,
+    "pool_pre_ping": settings.POSTGRES_POOL_PRE_PING,
+    "connect_args": {"prepare_threshold": settings.POSTGRES_PREPARE_THRESHOLD},
+}
+
+# Used by the API, scripts and tests use the blocking engine
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=InstrumentedAsyncAdaptedQueuePool,
+    **engine_options,
+)
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=InstrumentedQueuePool,
+    **engine_options,
+)
+
+
+def instrument_pool(db_engine: Engine, metrics: PoolMetrics) -> None:
+    event.listen(db_engine, "checkout", lambda *_args: metrics.record_checkout())
+    event.listen(db_engine, "checkin", lambda *_args: metrics.record_checkin())
+
+
+instrument_pool(engine, InstrumentedQueuePool.metrics)
+instrument_pool(async_engine.sync_engine, InstrumentedAsyncAdaptedQueuePool.metrics)
+
+# Read only, see app.api.deps.get_read_db
+replica_engines = [
+    create_async_engine(str(uri), poolclass=InstrumentedReplicaPool, **engine_options)
+    for uri in settings.SQLALCHEMY_REPLICA_DATABASE_URIS
+]
+for replica_engine in replica_engines:
+    instrument_pool(replica_engine.sync_engine, InstrumentedReplicaPool.metrics)
+
+
+def get_read_engine() -> AsyncEngine:
+    """
+    A random replica, or the primary when there are no replicas.
+    """
+    if not replica_engines:
+        return async_engine
+    return random.choice(replica_engines)
+
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+def pool_stats(db_engine: Engine) -> dict[str, float]:
+    pool = db_engine.pool
+    assert isinstance(pool, InstrumentedQueuePool)
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        **pool.metrics.stats(),
+    }
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -21,9 +154,7 @@ def init_db(session: Session) -> None:
     # This works because the models are already imported and registered from app.models
     # SQLModel.metadata.create_all(engine)
 
-    user = session.exec(
-        select(User).where(User.email == settings.FIRST_SUPERUSER)
-    ).first()
+    user = session.exec(crud.user_by_email_statement(settings.FIRST_SUPERUSER)).first()
     if not user:
         user_in = UserCreate(
             email=settings.FIRST_SUPERUSER,
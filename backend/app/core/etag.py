@@ -0,0 +1,28 @@
+from fastapi import Request, Response
+
+
+def make_etag(*parts: object) -> str:
+    """
+    Weak ETag made of the parts, such as an id and a row version.
+    """
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Whether the If-None-Match header of the request matches `etag`, with the
+    weak comparison.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(",")
+    )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,138 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, TypeVar
+
+from passlib.context import CryptContext
+
+T = TypeVar("T")
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HashingQueueFullError(Exception):
+    """Raised when the password hashing pool can't accept more work."""
+
+
+# These run inside the worker processes, they return the result together with
+# the worker side start time and the time spent hashing, so that the parent
+# process can tell queue wait apart from hashing time.
+
+
+def _hash(password: str) -> tuple[str, float, float]:
+    started_at = time.time()
+    start = time.perf_counter()
+    hashed_password = pwd_context.hash(password)
+    return hashed_password, started_at, time.perf_counter() - start
+
+
+def _verify(plain_password: str, hashed_password: str) -> tuple[bool, float, float]:
+    started_at = time.time()
+    start = time.perf_counter()
+    verified = pwd_context.verify(plain_password, hashed_password)
+    return verified, started_at, time.perf_counter() - start
+
+
+class PasswordHasher:
+    """
+    Bounded process pool for bcrypt hashing and verification.
+
+    bcrypt is CPU bound, running it in a separate process keeps the GIL and the
+    request threads of the API process free. At most `max_workers + max_queue`
+    operations are accepted at the same time, after that `HashingQueueFullError`
+    is raised instead of letting the backlog grow.
+    """
+
+    def __init__(self, *, max_workers: int, max_queue: int) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._queue_wait_seconds = 0.0
+        self._hash_seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn instead of fork, forking a process with running threads
+            # (the API threadpool, the DB pool) is not safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _submit(
+        self, fn: Callable[..., tuple[T, float, float]], *args: Any
+    ) -> "Future[T]":
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise HashingQueueFullError("Password hashing queue is full")
+            self._in_flight += 1
+            self._submitted += 1
+            executor = self._get_executor()
+        submitted_at = time.time()
+        result: Future[T] = Future()
+
+        def _done(worker_future: "Future[tuple[T, float, float]]") -> None:
+            with self._lock:
+                self._in_flight -= 1
+            try:
+                value, started_at, elapsed = worker_future.result()
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            with self._lock:
+                self._completed += 1
+                self._queue_wait_seconds += max(started_at - submitted_at, 0.0)
+                self._hash_seconds += elapsed
+            result.set_result(value)
+
+        try:
+            worker_future = executor.submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        worker_future.add_done_callback(_done)
+        return result
+
+    def hash_blocking(self, password: str) -> str:
+        return self._submit(_hash, password).result()
+
+    def verify_blocking(self, plain_password: str, hashed_password: str) -> bool:
+        return self._submit(_verify, plain_password, hashed_password).result()
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(_hash, password))
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await asyncio.wrap_future(
+            self._submit(_verify, plain_password, hashed_password)
+        )
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "queue_wait_seconds_total": self._queue_wait_seconds,
+                "hash_seconds_total": self._hash_seconds,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,38 @@
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+JobStatus = Literal["running", "succeeded", "failed"]
+
+
+@dataclass
+class Job:
+    """
+    Progress of a long running operation, updated in place while it runs.
+    """
+
+    owner_id: uuid.UUID
+    id: uuid.UUID = field(default_factory=uuid.uuid4)
+    status: JobStatus = "running"
+    progress: dict[str, int] = field(default_factory=dict)
+    # Capped to JOBS_MAX_ERRORS, progress keeps the totals
+    errors: list[dict[str, Any]] = field(default_factory=list)
+
+    def add_error(self, **error: Any) -> None:
+        if len(self.errors) < settings.JOBS_MAX_ERRORS:
+            self.errors.append(error)
+
+
+# Jobs of this worker process, by id, dropped JOBS_TTL_SECONDS after they start
+jobs: TTLCache[uuid.UUID, Job] = TTLCache(
+    maxsize=settings.JOBS_MAX_SIZE, ttl=settings.JOBS_TTL_SECONDS
+)
+
+
+def start_job(owner_id: uuid.UUID, **progress: int) -> Job:
+    job = Job(owner_id=owner_id, progress=progress)
+    jobs.set(job.id, job)
+    return job
@@ -0,0 +1,155 @@
+import base64
+import binascii
+import json
+import uuid
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any, Generic, Literal, TypeVar
+
+from pydantic_core import to_json
+from sqlalchemy import ColumnElement, text
+from sqlmodel import col, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import Item, User
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor can't be decoded."""
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Opaque cursor holding the sort key of the last row of a page.
+    """
+    data = json.dumps(values, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list[Any]:
+    """
+    Values of a cursor made by `encode_cursor` with `size` values.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorError(cursor)
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorError(cursor)
+    return values
+
+
+CountStrategy = Literal["exact", "estimated", "none"]
+
+T = TypeVar("T", Item, User)
+
+
+@dataclass
+class Page(Generic[T]):
+    # Dicts of the selected columns when paginating with `fields`
+    data: list[T] | list[dict[str, Any]]
+    # None with the "none" count strategy, and for pages after a cursor
+    count: int | None
+    has_more: bool
+    next_cursor: str | None
+
+    def to_json(self) -> bytes:
+        return to_json(
+            {
+                "data": self.data,
+                "count": self.count,
+                "has_more": self.has_more,
+                "next_cursor": self.next_cursor,
+            }
+        )
+
+
+async def _exact_count(
+    session: AsyncSession, model: type[T], where: Sequence[ColumnElement[bool]]
+) -> int:
+    statement = select(func.count()).select_from(model).where(*where)
+    return (await session.exec(statement)).one()
+
+
+async def _estimated_count(session: AsyncSession, model: type[T]) -> int | None:
+    # reltuples is -1 until the table is vacuumed or analyzed the first time
+    statement = text(
+        "SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"
+    )
+    result = await session.execute(statement, {"table": f'"{model.__tablename__}"'})
+    estimate: int | None = result.scalar_one_or_none()
+    return estimate if estimate is not None and estimate >= 0 else None
+
+
+async def paginate(
+    session: AsyncSession,
+    model: type[T],
+    *,
+    where: Sequence[ColumnElement[bool]] = (),
+    cursor_id: uuid.UUID | None,
+    skip: int,
+    limit: int,
+    count: CountStrategy,
+    fields: Sequence[str] | None = None,
+) -> Page[T]:
+    """
+    A page of `model` rows ordered by id, after `cursor_id` or else at `skip`.
+
+    With the "exact" strategy the rows are counted by a separate query, only
+    for pages without a cursor: following cursors doesn't change the count of
+    the first page, and counting again on every page would scan the whole set
+    each time. "estimated" reads the planner statistics instead, it only
+    applies without `where` filters and falls back to "exact" otherwise.
+    "none" skips counting, `has_more` still tells whether there's a next page.
+
+    With `fields`, only those columns are selected, and the page holds dicts
+    of them instead of `model` instances.
+    """
+    total_count: int | None = None
+    if count == "estimated" and not where:
+        total_count = await _estimated_count(session, model)
+    if cursor_id is None and (
+        count == "exact" or (count == "estimated" and total_count is None)
+    ):
+        total_count = await _exact_count(session, model, where)
+    columns: list[str] | None = None
+    if fields is not None:
+        # The id is always selected, for the cursor
+        columns = ["id"] + [name for name in fields if name != "id"]
+
+    statement: Any
+    if columns is None:
+        statement = select(model)
+    else:
+        table = model.__table__  # type: ignore[attr-defined]
+        statement = table.select().with_only_columns(
+            *(table.c[name] for name in columns)
+        )
+    statement = statement.where(*where).order_by(col(model.id))
+    if cursor_id is not None:
+        statement = statement.where(col(model.id) > cursor_id)
+    else:
+        statement = statement.offset(skip)
+    # One extra row tells whether there's a next page
+    statement = statement.limit(limit + 1)
+    results: Sequence[Any]
+    if columns is None:
+        results = (await session.exec(statement)).all()
+    else:
+        # Rows of columns, without ORM instances or identity map
+        results = (await session.execute(statement)).all()
+
+    has_more = len(results) > limit
+    results = results[:limit]
+    data: list[Any]
+    if fields is not None:
+        data = [{name: getattr(row, name) for name in fields} for row in results]
+        ids = [row.id for row in results]
+    else:
+        data = list(results)
+        ids = [entity.id for entity in data]
+    next_cursor = encode_cursor(ids[-1]) if has_more and ids else None
+    return Page(
+        data=data, count=total_count, has_more=has_more, next_cursor=next_cursor
+    )
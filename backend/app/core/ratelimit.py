@@ -0,0 +1,193 @@
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Protocol
+
+from app.core.config import settings
+
+IPNetwork = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+class TokenBucketStore(Protocol):
+    """
+    Storage for token buckets.
+
+    A deployment running several workers (or servers) can plug a shared
+    implementation (e.g. Redis) so that all of them enforce the same limits.
+    """
+
+    def take(self, key: str, *, capacity: float, refill_per_second: float) -> float:
+        """
+        Take a token from the bucket `key`.
+
+        Return 0 if a token was available, otherwise the seconds to wait until
+        one is.
+        """
+        ...
+
+    def peek(self, key: str, *, capacity: float, refill_per_second: float) -> float:
+        """
+        Like take, without taking the token.
+        """
+        ...
+
+    def clear(self) -> None: ...
+
+
+class InMemoryTokenBucketStore:
+    """
+    Per process `TokenBucketStore`, each bucket is a (tokens, updated_at) tuple.
+
+    The least recently used buckets are dropped when there are more than
+    `maxsize`, a dropped bucket starts over full.
+    """
+
+    def __init__(self, *, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, *, capacity: float, refill_per_second: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - tokens) / refill_per_second
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def peek(self, key: str, *, capacity: float, refill_per_second: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+        return 0.0 if tokens >= 1 else (1 - tokens) / refill_per_second
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter, allows bursts of `burst` requests per key and
+    then `per_minute` requests per minute.
+    """
+
+    def __init__(
+        self, *, name: str, burst: int, per_minute: int, store: TokenBucketStore
+    ) -> None:
+        self.name = name
+        self.burst = burst
+        self.per_minute = per_minute
+        self.store = store
+        self.allowed = 0
+        self.rejected = 0
+        # Requests are counted from the event loop and from threads
+        self._lock = threading.Lock()
+
+    def _count(self, retry_after: float) -> float:
+        with self._lock:
+            if retry_after:
+                self.rejected += 1
+            else:
+                self.allowed += 1
+        return retry_after
+
+    def hit(self, key: str) -> float:
+        """
+        Count a request for `key`, return 0 if it's allowed, otherwise the
+        seconds until it would be.
+        """
+        if self.burst <= 0 or self.per_minute <= 0:
+            return 0.0
+        retry_after = self.store.take(
+            f"{self.name}:{key}",
+            capacity=self.burst,
+            refill_per_second=self.per_minute / 60,
+        )
+        return self._count(retry_after)
+
+    def check(self, key: str) -> float:
+        """
+        Like hit, without counting the request against `key`, for limits
+        charged afterwards only when the request fails.
+        """
+        if self.burst <= 0 or self.per_minute <= 0:
+            return 0.0
+        retry_after = self.store.peek(
+            f"{self.name}:{key}",
+            capacity=self.burst,
+            refill_per_second=self.per_minute / 60,
+        )
+        return self._count(retry_after)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {"allowed": self.allowed, "rejected": self.rejected}
+
+
+def _trusted_proxy(address: str, networks: Sequence[IPNetwork]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_ip(
+    peer: str,
+    forwarded_for: Sequence[str],
+    trusted_proxies: Sequence[IPNetwork],
+) -> str:
+    """
+    IP of the client of a request from `peer` with the X-Forwarded-For
+    headers `forwarded_for`: the last address that wasn't added by one of the
+    `trusted_proxies`, the header is ignored when `peer` isn't one of them.
+    """
+    if not _trusted_proxy(peer, trusted_proxies):
+        return peer
+    addresses = [a.strip() for header in forwarded_for for a in header.split(",")]
+    for address in reversed(addresses):
+        if not address:
+            continue
+        if not _trusted_proxy(address, trusted_proxies):
+            return address
+        peer = address
+    return peer
+
+
+# Limits for the unauthenticated endpoints that hash passwords or send emails,
+# see app.api.deps.check_auth_rate_limit
+auth_rate_limit_store: TokenBucketStore = InMemoryTokenBucketStore(
+    maxsize=settings.AUTH_RATE_LIMIT_MAX_KEYS
+)
+ip_rate_limiter = RateLimiter(
+    name="ip",
+    burst=settings.AUTH_RATE_LIMIT_IP_BURST,
+    per_minute=settings.AUTH_RATE_LIMIT_IP_PER_MINUTE,
+    store=auth_rate_limit_store,
+)
+# The account limit is only charged by failed logins, so that anyone can't
+# lock a user out by submitting their email
+account_rate_limiter = RateLimiter(
+    name="account",
+    burst=settings.AUTH_RATE_LIMIT_ACCOUNT_BURST,
+    per_minute=settings.AUTH_RATE_LIMIT_ACCOUNT_PER_MINUTE,
+    store=auth_rate_limit_store,
+)
+
+trusted_proxies = [
+    ipaddress.ip_network(network.strip())
+    for network in settings.TRUSTED_PROXIES.split(",")
+    if network.strip()
+]
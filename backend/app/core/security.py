@@ -1,27 +1,88 @@
+import hashlib
+import secrets
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
 import jwt
-from passlib.context import CryptContext
 
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.core.hashing import PasswordHasher
+from app.models import TokenPayload
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+)
 
 
 ALGORITHM = "HS256"
 
+# Validated access tokens, keyed by the SHA-256 digest of the token, entries
+# never outlive the "exp" claim of their token
+token_cache: TTLCache[bytes, TokenPayload] = TTLCache(
+    maxsize=settings.TOKEN_CACHE_MAX_SIZE, ttl=settings.TOKEN_CACHE_TTL_SECONDS
+)
 
-def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
+
+def create_access_token(
+    subject: str | Any,
+    expires_delta: timedelta,
+    *,
+    is_superuser: bool = False,
+    is_active: bool = True,
+    token_version: int = 0,
+) -> str:
     expire = datetime.now(timezone.utc) + expires_delta
-    to_encode = {"exp": expire, "sub": str(subject)}
+    to_encode = {
+        "exp": expire,
+        "sub": str(subject),
+        "is_superuser": is_superuser,
+        "is_active": is_active,
+        "token_version": token_version,
+    }
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def decode_access_token(token: str) -> TokenPayload:
+    """
+    Decode and validate an access token.
+
+    Raises `jwt.InvalidTokenError` or `pydantic.ValidationError` when the token
+    is not valid.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    token_data = token_cache.get(key)
+    if token_data is not None:
+        return token_data
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    token_data = TokenPayload(**payload)
+    exp = payload.get("exp")
+    token_cache.set(key, token_data, ttl=None if exp is None else exp - time.time())
+    return token_data
+
+
+def generate_refresh_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def hash_refresh_token(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify_blocking(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_hasher.hash_blocking(password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.hash(password)
@@ -1,10 +1,54 @@
+import heapq
+import itertools
 import uuid
-from typing import Any
+from collections.abc import Sequence
+from datetime import datetime, timedelta, timezone
+from typing import Any, Literal
 
-from sqlmodel import Session, select
+from sqlalchemy import (
+    REAL,
+    ColumnElement,
+    and_,
+    cast,
+    insert,
+    literal,
+    literal_column,
+    or_,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.sql.dml import ReturningDelete
+from sqlmodel import Session, col, delete, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import Select, SelectOfScalar
 
-from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
+from app.core.cache import invalidate_principal
+from app.core.config import settings
+from app.core.jobs import Job
+from app.core.security import (
+    generate_refresh_token,
+    get_password_hash,
+    get_password_hash_async,
+    hash_refresh_token,
+    verify_password,
+    verify_password_async,
+)
+from app.models import (
+    Item,
+    ItemCreate,
+    ItemsFilter,
+    ItemTombstone,
+    ItemUpdate,
+    RefreshToken,
+    User,
+    UserCreate,
+    UserUpdate,
+    bump_items_version,
+)
+
+# The API uses the async functions, the blocking ones are kept for scripts
+# (app.initial_data) and tests
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -13,42 +57,526 @@ def create_user(*, session: Session, user_create: UserCreate) -> User:
     )
     session.add(db_obj)
     session.commit()
-    session.refresh(db_obj)
     return db_obj
 
 
+async def create_user_async(*, session: AsyncSession, user_create: UserCreate) -> User:
+    hashed_password = await get_password_hash_async(user_create.password)
+    db_obj = User.model_validate(
+        user_create, update={"hashed_password": hashed_password}
+    )
+    session.add(db_obj)
+    await session.commit()
+    return db_obj
+
+
+def _revokes_tokens(db_user: User, user_data: dict[str, Any]) -> bool:
+    return "password" in user_data or any(
+        key in user_data and user_data[key] != getattr(db_user, key)
+        for key in ("is_active", "is_superuser")
+    )
+
+
 def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
     user_data = user_in.model_dump(exclude_unset=True)
-    extra_data = {}
+    extra_data: dict[str, Any] = {}
     if "password" in user_data:
         password = user_data["password"]
         hashed_password = get_password_hash(password)
         extra_data["hashed_password"] = hashed_password
+    if _revokes_tokens(db_user, user_data):
+        # Revoke the access tokens issued with the previous password or claims,
+        # incremented by the database like User.version
+        extra_data["token_version"] = col(User.token_version) + 1
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
     session.commit()
-    session.refresh(db_user)
+    invalidate_principal(db_user.id)
+    return db_user
+
+
+async def update_user_async(
+    *, session: AsyncSession, db_user: User, user_in: UserUpdate
+) -> User:
+    user_data = user_in.model_dump(exclude_unset=True)
+    extra_data: dict[str, Any] = {}
+    if "password" in user_data:
+        extra_data["hashed_password"] = await get_password_hash_async(
+            user_data["password"]
+        )
+    if _revokes_tokens(db_user, user_data):
+        extra_data["token_version"] = col(User.token_version) + 1
+    db_user.sqlmodel_update(user_data, update=extra_data)
+    session.add(db_user)
+    await session.commit()
+    invalidate_principal(db_user.id)
     return db_user
 
 
+def user_by_email_statement(email: str) -> SelectOfScalar[User]:
+    """
+    Case insensitive lookup of a user, served by the ix_user_email_lower index.
+    """
+    return select(User).where(func.lower(User.email) == email.lower())
+
+
+def users_filter(
+    *,
+    email_prefix: str | None = None,
+    email_contains: str | None = None,
+    full_name_contains: str | None = None,
+    is_active: bool | None = None,
+    is_superuser: bool | None = None,
+) -> list[ColumnElement[bool]]:
+    """
+    Conditions of the filters of GET /users/, each one is served by an index
+    (substrings need at least 3 characters for the trigram indexes).
+    """
+    where: list[ColumnElement[bool]] = []
+    # Emails are stored in lower case
+    if email_prefix is not None:
+        where.append(col(User.email).startswith(email_prefix.lower(), autoescape=True))
+    if email_contains is not None:
+        where.append(col(User.email).contains(email_contains.lower(), autoescape=True))
+    if full_name_contains is not None:
+        where.append(col(User.full_name).icontains(full_name_contains, autoescape=True))
+    if is_active is not None:
+        where.append(col(User.is_active) == is_active)
+    if is_superuser is not None:
+        where.append(col(User.is_superuser) == is_superuser)
+    return where
+
+
 def get_user_by_email(*, session: Session, email: str) -> User | None:
-    statement = select(User).where(User.email == email)
-    session_user = session.exec(statement).first()
+    session_user = session.exec(user_by_email_statement(email)).first()
     return session_user
 
 
+async def get_user_by_email_async(*, session: AsyncSession, email: str) -> User | None:
+    return (await session.exec(user_by_email_statement(email))).first()
+
+
 def authenticate(*, session: Session, email: str, password: str) -> User | None:
     db_user = get_user_by_email(session=session, email=email)
-    if not db_user:
+    if not db_user or db_user.deleted_at:
         return None
     if not verify_password(password, db_user.hashed_password):
         return None
     return db_user
 
 
+async def authenticate_async(
+    *, session: AsyncSession, email: str, password: str
+) -> User | None:
+    db_user = await get_user_by_email_async(session=session, email=email)
+    if not db_user or db_user.deleted_at:
+        return None
+    if not await verify_password_async(password, db_user.hashed_password):
+        return None
+    return db_user
+
+
+async def mark_user_deleted_async(*, session: AsyncSession, db_user: User) -> None:
+    """
+    Deactivate a user and revoke their tokens, before purging them with
+    purge_user_async.
+    """
+    db_user.deleted_at = datetime.now(timezone.utc)
+    db_user.is_active = False
+    # Incremented by the database, `db_user` can be the cached principal
+    db_user.token_version = col(User.token_version) + 1  # type: ignore[assignment]
+    await session.commit()
+    invalidate_principal(db_user.id)
+
+
+async def purge_user_async(
+    *, session: AsyncSession, user_id: uuid.UUID, batch_size: int, job: Job
+) -> None:
+    """
+    Delete the items of a user marked as deleted, one batch per transaction so
+    locks are held briefly, then the user.
+
+    Purges of the same user can overlap (a deletion requested again, the
+    sweep of every worker): batches skip the items another purge is deleting,
+    and the purge that finds them left to the other one stops there. The user
+    is only deleted once no item is left, never by cascading to its items.
+    """
+    while True:
+        batch = (
+            select(Item.id)
+            .where(col(Item.owner_id) == user_id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        statement = delete(Item).where(col(Item.id).in_(batch))
+        result = await session.execute(statement)
+        await session.commit()
+        count: int = result.rowcount  # type: ignore[attr-defined]
+        job.progress["items_deleted"] += count
+        if count < batch_size:
+            break
+    # The items left, if any, are being deleted by another purge
+    remaining = select(Item.id).where(col(Item.owner_id) == user_id).limit(1)
+    if (await session.exec(remaining)).first() is not None:
+        return
+    # The rest (tokens, tombstones) is deleted by ON DELETE CASCADE
+    await session.execute(delete(User).where(col(User.id) == user_id))
+    await session.commit()
+
+
+async def get_deleted_user_ids_async(
+    *, session: AsyncSession, deleted_before: datetime
+) -> list[uuid.UUID]:
+    """
+    Ids of the users marked as deleted before `deleted_before` that are still
+    there, their purge was interrupted (e.g. by a restart).
+    """
+    statement = select(User.id).where(col(User.deleted_at) < deleted_before)
+    return list((await session.exec(statement)).all())
+
+
 def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
     session.add(db_item)
     session.commit()
-    session.refresh(db_item)
     return db_item
+
+
+async def create_item_async(
+    *, session: AsyncSession, item_in: ItemCreate, owner_id: uuid.UUID
+) -> Item:
+    db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
+    session.add(db_item)
+    await session.commit()
+    return db_item
+
+
+# Rows per multi-row INSERT, well under the 65535 bind parameters of a statement
+BULK_INSERT_PAGE_SIZE = 1000
+
+
+async def create_items_async(
+    *, session: AsyncSession, items_in: Sequence[ItemCreate], owner_id: uuid.UUID
+) -> list[uuid.UUID]:
+    """
+    Insert the items in one transaction, with multi-row INSERT ... RETURNING
+    statements of up to BULK_INSERT_PAGE_SIZE rows.
+    """
+    rows = [
+        {**item_in.model_dump(), "id": uuid.uuid4(), "owner_id": owner_id}
+        for item_in in items_in
+    ]
+    if not rows:
+        return []
+    statement = insert(Item).returning(col(Item.id), sort_by_parameter_order=True)
+    result = await session.execute(
+        statement,
+        rows,
+        execution_options={"insertmanyvalues_page_size": BULK_INSERT_PAGE_SIZE},
+    )
+    ids = list(result.scalars())
+    await session.execute(bump_items_version([owner_id]))
+    await session.commit()
+    return ids
+
+
+def _items_filter(
+    items_filter: ItemsFilter, owner_id: uuid.UUID | None
+) -> list[ColumnElement[bool]]:
+    where: list[ColumnElement[bool]] = []
+    if items_filter.ids is not None:
+        where.append(col(Item.id).in_(items_filter.ids))
+    if items_filter.title is not None:
+        where.append(col(Item.title) == items_filter.title)
+    if items_filter.owner_id is not None:
+        where.append(col(Item.owner_id) == items_filter.owner_id)
+    if owner_id is not None:
+        where.append(col(Item.owner_id) == owner_id)
+    return where
+
+
+async def update_items_async(
+    *,
+    session: AsyncSession,
+    items_filter: ItemsFilter,
+    item_in: ItemUpdate,
+    owner_id: uuid.UUID | None,
+) -> int:
+    """
+    Update the matching items with a single UPDATE, only those of `owner_id`
+    unless it's None. Return the number of updated items.
+    """
+    statement = (
+        update(Item)
+        .where(*_items_filter(items_filter, owner_id))
+        .values(**item_in.model_dump(exclude_unset=True), version=col(Item.version) + 1)
+        .returning(col(Item.owner_id))
+        .execution_options(synchronize_session=False)
+    )
+    owner_ids = (await session.execute(statement)).scalars().all()
+    if owner_ids:
+        await session.execute(bump_items_version(set(owner_ids)))
+    await session.commit()
+    return len(owner_ids)
+
+
+async def delete_items_async(
+    *, session: AsyncSession, items_filter: ItemsFilter, owner_id: uuid.UUID | None
+) -> int:
+    """
+    Delete the matching items with a single DELETE, only those of `owner_id`
+    unless it's None. Return the number of deleted items.
+    """
+    statement = (
+        delete(Item)
+        .where(*_items_filter(items_filter, owner_id))
+        .returning(col(Item.owner_id))
+        .execution_options(synchronize_session=False)
+    )
+    owner_ids = (await session.execute(statement)).scalars().all()
+    if owner_ids:
+        await session.execute(bump_items_version(set(owner_ids)))
+    await session.commit()
+    return len(owner_ids)
+
+
+ItemSearchMode = Literal["fulltext", "trigram"]
+
+
+def search_items_statement(
+    *,
+    query: str,
+    mode: ItemSearchMode,
+    owner_id: uuid.UUID | None,
+    after: tuple[float, uuid.UUID] | None = None,
+    limit: int,
+) -> Select[tuple[Item, Any]]:
+    """
+    Items matching `query` with their rank, best first, only those of
+    `owner_id` unless it's None.
+
+    "fulltext" matches the words of the query (web search syntax) against the
+    title and description, "trigram" matches it as a prefix or with typos
+    against the title. `after` is the (rank, id) of the last item of the
+    previous page.
+    """
+    if mode == "fulltext":
+        search_vector = Item.__table__.c.search_vector  # type: ignore[attr-defined]
+        tsquery = func.websearch_to_tsquery(
+            literal_column("'english'::regconfig"), query
+        )
+        score = func.ts_rank_cd(search_vector, tsquery)
+        match = search_vector.op("@@")(tsquery)
+    else:
+        score = func.word_similarity(query, col(Item.title))
+        match = literal(query).op("<%")(col(Item.title))
+    rank = score.label("rank")
+    statement = (
+        select(Item, rank).where(match).order_by(rank.desc(), col(Item.id)).limit(limit)
+    )
+    if owner_id is not None:
+        statement = statement.where(col(Item.owner_id) == owner_id)
+    if after is not None:
+        # Ranks are real, compare in real so the last rank of a page equals itself
+        after_rank = cast(after[0], REAL)
+        statement = statement.where(
+            or_(
+                score < after_rank,
+                and_(score == after_rank, col(Item.id) > after[1]),
+            )
+        )
+    return statement
+
+
+async def search_items_async(
+    *,
+    session: AsyncSession,
+    query: str,
+    mode: ItemSearchMode,
+    owner_id: uuid.UUID | None,
+    after: tuple[float, uuid.UUID] | None = None,
+    limit: int,
+) -> list[tuple[Item, float]]:
+    statement = search_items_statement(
+        query=query, mode=mode, owner_id=owner_id, after=after, limit=limit
+    )
+    results = await session.execute(statement)
+    return list(results.tuples().all())
+
+
+# A change of an item: (change_xid, change_seq, the item or the id of the
+# deleted item)
+ItemChange = tuple[int, int, Item | uuid.UUID]
+
+
+def _changed_after(
+    columns: Any, owner_id: uuid.UUID | None, after: tuple[int, int], horizon: int
+) -> list[ColumnElement[bool]]:
+    where = [
+        tuple_(columns.change_xid, columns.change_seq)
+        > tuple_(literal(after[0]), literal(after[1])),
+        columns.change_xid < horizon,
+    ]
+    if owner_id is not None:
+        where.append(columns.owner_id == owner_id)
+    return where
+
+
+def item_changes_statements(
+    *,
+    owner_id: uuid.UUID | None,
+    after: tuple[int, int],
+    horizon: int,
+    limit: int,
+) -> tuple[Select[tuple[Item, Any, Any]], Select[tuple[uuid.UUID, int, int]]]:
+    """
+    Items, and tombstones of deleted items, changed after the (change_xid,
+    change_seq) position `after` by transactions older than `horizon`, in the
+    order of the changes, only those of `owner_id` unless it's None.
+    """
+    item_columns = Item.__table__.c  # type: ignore[attr-defined]
+    items = (
+        select(Item, item_columns.change_xid, item_columns.change_seq)
+        .where(*_changed_after(item_columns, owner_id, after, horizon))
+        .order_by(item_columns.change_xid, item_columns.change_seq)
+        .limit(limit)
+    )
+    tombstone_columns = ItemTombstone.__table__.c  # type: ignore[attr-defined]
+    tombstones = (
+        select(
+            col(ItemTombstone.id),
+            col(ItemTombstone.change_xid),
+            col(ItemTombstone.change_seq),
+        )
+        .where(*_changed_after(tombstone_columns, owner_id, after, horizon))
+        .order_by(tombstone_columns.change_xid, tombstone_columns.change_seq)
+        .limit(limit)
+    )
+    return items, tombstones
+
+
+async def read_item_changes_async(
+    *,
+    session: AsyncSession,
+    owner_id: uuid.UUID | None,
+    after: tuple[int, int],
+    limit: int,
+) -> list[ItemChange]:
+    """
+    Up to `limit` changes of items after the (change_xid, change_seq) position
+    `after`, only those of `owner_id` unless it's None.
+
+    Changes are ordered by the transaction that made them, and only the
+    changes of the transactions older than every running one are returned.
+    A transaction still running could otherwise commit changes that come
+    before the last one returned, and that a client would never get.
+    """
+    horizon = (
+        await session.execute(
+            text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        )
+    ).scalar_one()
+    items_statement, tombstones_statement = item_changes_statements(
+        owner_id=owner_id, after=after, horizon=horizon, limit=limit
+    )
+    items = [
+        (xid, seq, item)
+        for item, xid, seq in (await session.execute(items_statement)).all()
+    ]
+    tombstones = [
+        (xid, seq, item_id)
+        for item_id, xid, seq in (await session.execute(tombstones_statement)).all()
+    ]
+    changes = heapq.merge(items, tombstones, key=lambda change: change[:2])
+    return list(itertools.islice(changes, limit))
+
+
+def _new_refresh_token(user: User) -> tuple[str, RefreshToken]:
+    token = generate_refresh_token()
+    expires_at = datetime.now(timezone.utc) + timedelta(
+        minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES
+    )
+    db_token = RefreshToken(
+        token_hash=hash_refresh_token(token),
+        user_id=user.id,
+        token_version=user.token_version,
+        expires_at=expires_at,
+    )
+    return token, db_token
+
+
+def create_refresh_token(*, session: Session, user: User) -> str:
+    token, db_token = _new_refresh_token(user)
+    session.add(db_token)
+    session.commit()
+    return token
+
+
+async def create_refresh_token_async(*, session: AsyncSession, user: User) -> str:
+    token, db_token = _new_refresh_token(user)
+    session.add(db_token)
+    await session.commit()
+    return token
+
+
+def _consume_refresh_token(token: str) -> ReturningDelete[tuple[uuid.UUID, int]]:
+    # A single DELETE ... RETURNING, so concurrent requests can't use the same
+    # token twice
+    return (
+        delete(RefreshToken)
+        .where(
+            col(RefreshToken.token_hash) == hash_refresh_token(token),
+            col(RefreshToken.expires_at) > datetime.now(timezone.utc),
+        )
+        .returning(col(RefreshToken.user_id), col(RefreshToken.token_version))
+    )
+
+
+def rotate_refresh_token(*, session: Session, token: str) -> tuple[User, str] | None:
+    """
+    Consume a refresh token and issue its replacement.
+    """
+    row = session.execute(_consume_refresh_token(token)).first()
+    if not row:
+        session.rollback()
+        return None
+    user = session.get(User, row.user_id)
+    if not user or not user.is_active or user.token_version != row.token_version:
+        session.commit()
+        return None
+    return user, create_refresh_token(session=session, user=user)
+
+
+async def rotate_refresh_token_async(
+    *, session: AsyncSession, token: str
+) -> tuple[User, str] | None:
+    """
+    Consume a refresh token and issue its replacement.
+    """
+    row = (await session.execute(_consume_refresh_token(token))).first()
+    if not row:
+        await session.rollback()
+        return None
+    user = await session.get(User, row.user_id)
+    if not user or not user.is_active or user.token_version != row.token_version:
+        await session.commit()
+        return None
+    return user, await create_refresh_token_async(session=session, user=user)
+
+
+def delete_expired_refresh_tokens(*, session: Session, batch_size: int) -> int:
+    deleted = 0
+    while True:
+        expired = (
+            select(RefreshToken.token_hash)
+            .where(col(RefreshToken.expires_at) <= datetime.now(timezone.utc))
+            .limit(batch_size)
+        )
+        statement = delete(RefreshToken).where(
+            col(RefreshToken.token_hash).in_(expired)
+        )
+        count: int = session.execute(statement).rowcount  # type: ignore[attr-defined]
+        session.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
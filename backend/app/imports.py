@@ -0,0 +1,207 @@
+import csv
+import json
+import uuid
+from collections.abc import AsyncIterable, AsyncIterator
+from typing import Any, Literal
+
+from psycopg import AsyncConnection
+from pydantic import ValidationError
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.jobs import Job
+from app.models import ItemCreate, bump_items_version
+
+ImportFormat = Literal["ndjson", "csv"]
+
+# Valid rows are copied into item and committed in batches
+IMPORT_BATCH_SIZE = 5000
+# Longer lines are rejected without being buffered, CSV records spanning
+# several lines are limited to this in total
+IMPORT_MAX_LINE_LENGTH = 64 * 1024
+
+
+class RejectedRowError(ValueError):
+    """Raised for a row that can't be parsed."""
+
+
+async def _lines(
+    chunks: AsyncIterable[bytes],
+) -> AsyncIterator[tuple[int, bytes | RejectedRowError]]:
+    """
+    Numbered lines of a body received in chunks, lines longer than
+    IMPORT_MAX_LINE_LENGTH are dropped as they come and rejected.
+    """
+    line_number = 0
+    buffer = bytearray()
+    # Set while dropping the rest of a line that's too long
+    too_long = False
+    too_long_error = f"Longer than {IMPORT_MAX_LINE_LENGTH} bytes"
+    async for chunk in chunks:
+        # The start of the buffer was searched with the previous chunks
+        start = 0
+        search_from = len(buffer)
+        buffer += chunk
+        while (end := buffer.find(b"\n", search_from)) != -1:
+            line_number += 1
+            if too_long or end - start > IMPORT_MAX_LINE_LENGTH:
+                yield line_number, RejectedRowError(too_long_error)
+                too_long = False
+            else:
+                yield line_number, bytes(buffer[start:end]).rstrip(b"\r")
+            start = search_from = end + 1
+        del buffer[:start]
+        if len(buffer) > IMPORT_MAX_LINE_LENGTH:
+            too_long = True
+            buffer.clear()
+    if too_long:
+        yield line_number + 1, RejectedRowError(too_long_error)
+    elif buffer.strip():
+        yield line_number + 1, bytes(buffer).rstrip(b"\r")
+
+
+def _decode(line: bytes) -> str:
+    try:
+        return line.decode()
+    except UnicodeDecodeError:
+        raise RejectedRowError("Not valid UTF-8")
+
+
+def _ndjson_row(line: bytes) -> dict[str, Any]:
+    try:
+        row = json.loads(_decode(line))
+    except json.JSONDecodeError as e:
+        raise RejectedRowError(f"Invalid JSON: {e.msg}")
+    if not isinstance(row, dict):
+        raise RejectedRowError("Expected a JSON object")
+    return row
+
+
+async def parse_rows(
+    chunks: AsyncIterable[bytes], format: ImportFormat
+) -> AsyncIterator[tuple[int, dict[str, Any] | RejectedRowError]]:
+    """
+    The rows of an NDJSON or CSV body, or the reason they can't be parsed,
+    with the line where they start.
+
+    CSV bodies start with a header, a quoted field can span several lines.
+    """
+    header: list[str] | None = None
+    record: list[str] = []
+    record_line = 0
+    record_length = 0
+    async for line_number, line in _lines(chunks):
+        if isinstance(line, RejectedRowError):
+            # The record it's part of is rejected with it
+            yield record_line if record else line_number, line
+            record = []
+            continue
+        if format == "ndjson":
+            if line.strip():
+                try:
+                    yield line_number, _ndjson_row(line)
+                except RejectedRowError as e:
+                    yield line_number, e
+            continue
+        try:
+            decoded = _decode(line)
+        except RejectedRowError as e:
+            yield line_number, e
+            continue
+        if not record:
+            if not decoded.strip():
+                continue
+            record_line = line_number
+            record_length = 0
+        record.append(decoded)
+        record_length += len(line) + 1
+        if record_length > IMPORT_MAX_LINE_LENGTH:
+            yield (
+                record_line,
+                RejectedRowError(f"Longer than {IMPORT_MAX_LINE_LENGTH} bytes"),
+            )
+            record = []
+            continue
+        # An odd number of quotes means a quoted field continues on next line
+        if sum(part.count('"') for part in record) % 2:
+            continue
+        values = next(csv.reader(["\n".join(record)]))
+        record = []
+        if header is None:
+            header = [name.strip() for name in values]
+        elif len(values) != len(header):
+            yield (
+                record_line,
+                RejectedRowError(f"Expected {len(header)} fields, got {len(values)}"),
+            )
+        else:
+            # CSV has no nulls, empty fields are missing values
+            yield (
+                record_line,
+                {k: v for k, v in zip(header, values, strict=True) if v != ""},
+            )
+    if record:
+        yield record_line, RejectedRowError("Unterminated quoted field")
+
+
+def _reject_reason(e: RejectedRowError | ValidationError) -> str:
+    if isinstance(e, RejectedRowError):
+        return str(e)
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+        for error in e.errors()
+    )
+
+
+async def _import_batch(
+    session: AsyncSession,
+    owner_id: uuid.UUID,
+    rows: list[tuple[str, str | None]],
+) -> None:
+    sa_connection = await session.connection()
+    raw_connection = await sa_connection.get_raw_connection()
+    connection: AsyncConnection[Any] = raw_connection.driver_connection  # type: ignore[assignment]
+    async with connection.cursor() as cursor:
+        async with cursor.copy(
+            "COPY item (id, title, description, owner_id) FROM STDIN"
+        ) as copy:
+            for title, description in rows:
+                await copy.write_row((uuid.uuid4(), title, description, owner_id))
+    await session.execute(bump_items_version([owner_id]))
+    await session.commit()
+
+
+async def import_items(
+    *,
+    session: AsyncSession,
+    owner_id: uuid.UUID,
+    chunks: AsyncIterable[bytes],
+    format: ImportFormat,
+    job: Job,
+) -> None:
+    """
+    Import the items of an NDJSON or CSV body as they are received.
+
+    Valid rows are copied into item and committed in batches, so that a long
+    upload doesn't hold a transaction open (and `/items/changes` back) while
+    it runs. If the import fails, the batches committed before stay imported,
+    `job` tells how many rows. Invalid rows are counted and reported in `job`.
+    """
+    batch: list[tuple[str, str | None]] = []
+    async for line_number, row in parse_rows(chunks, format):
+        job.progress["read"] += 1
+        try:
+            if isinstance(row, RejectedRowError):
+                raise row
+            item_in = ItemCreate.model_validate(row)
+        except (RejectedRowError, ValidationError) as e:
+            job.progress["rejected"] += 1
+            job.add_error(line=line_number, error=_reject_reason(e))
+            continue
+        batch.append((item_in.title, item_in.description))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await _import_batch(session, owner_id, batch)
+            job.progress["imported"] += len(batch)
+            batch = []
+    if batch:
+        await _import_batch(session, owner_id, batch)
+        job.progress["imported"] += len(batch)
@@ -1,16 +1,94 @@
+import asyncio
+import logging
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from starlette.middleware.cors import CORSMiddleware
 
+from app import crud
+from app.api.deps import READ_YOUR_WRITES_COOKIE
 from app.api.main import api_router
 from app.core.config import settings
+from app.core.db import async_engine, engine, replica_engines
+from app.core.hashing import HashingQueueFullError
+from app.core.jobs import Job
+from app.core.security import password_hasher
+
+logger = logging.getLogger(__name__)
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
 
 
+def delete_expired_refresh_tokens() -> None:
+    with Session(engine) as session:
+        deleted = crud.delete_expired_refresh_tokens(
+            session=session, batch_size=settings.REFRESH_TOKEN_CLEANUP_BATCH_SIZE
+        )
+    logger.info(f"Deleted {deleted} expired refresh tokens")
+
+
+async def cleanup_refresh_tokens_periodically() -> None:
+    while True:
+        await asyncio.sleep(settings.REFRESH_TOKEN_CLEANUP_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(delete_expired_refresh_tokens)
+        except Exception:
+            logger.exception("Failed to delete expired refresh tokens")
+
+
+async def purge_deleted_users() -> None:
+    # Older than the interval, so purges still running elsewhere are left alone
+    deleted_before = datetime.now(timezone.utc) - timedelta(
+        seconds=settings.USER_PURGE_SWEEP_INTERVAL_SECONDS
+    )
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        user_ids = await crud.get_deleted_user_ids_async(
+            session=session, deleted_before=deleted_before
+        )
+        for user_id in user_ids:
+            job = Job(owner_id=user_id, progress={"items_deleted": 0})
+            await crud.purge_user_async(
+                session=session,
+                user_id=user_id,
+                batch_size=settings.USER_DELETE_BATCH_SIZE,
+                job=job,
+            )
+    if user_ids:
+        logger.info(f"Purged {len(user_ids)} deleted users")
+
+
+async def purge_deleted_users_periodically() -> None:
+    while True:
+        try:
+            await purge_deleted_users()
+        except Exception:
+            logger.exception("Failed to purge deleted users")
+        await asyncio.sleep(settings.USER_PURGE_SWEEP_INTERVAL_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncGenerator[None, None]:
+    cleanup_task = asyncio.create_task(cleanup_refresh_tokens_periodically())
+    purge_task = asyncio.create_task(purge_deleted_users_periodically())
+    yield
+    cleanup_task.cancel()
+    purge_task.cancel()
+    password_hasher.shutdown()
+    await async_engine.dispose()
+    for replica_engine in replica_engines:
+        await replica_engine.dispose()
+
+
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
@@ -18,6 +96,7 @@ app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -30,4 +109,36 @@ if settings.all_cors_origins:
         allow_headers=["*"],
     )
 
+
+@app.middleware("http")
+async def set_read_your_writes_cookie(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    response = await call_next(request)
+    if (
+        request.method not in ("GET", "HEAD", "OPTIONS")
+        and response.status_code < 400
+        and replica_engines
+    ):
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE,
+            "1",
+            max_age=settings.READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite="lax",
+        )
+    return response
+
+
+@app.exception_handler(HashingQueueFullError)
+async def hashing_queue_full_handler(
+    _request: Request, _exc: HashingQueueFullError
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -1,12 +1,36 @@
 import uuid
-
-from pydantic import EmailStr
-from sqlmodel import Field, Relationship, SQLModel
+from collections.abc import Collection
+from datetime import datetime
+from typing import Annotated, Any, Literal
+
+from pydantic import AfterValidator, EmailStr, model_validator
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Computed,
+    Connection,
+    DateTime,
+    Index,
+    Sequence,
+    Update,
+    event,
+    func,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import Mapper, object_session
+from sqlmodel import Field, Relationship, SQLModel, col
+from typing_extensions import Self
+
+# Emails are stored in lower case, and looked up by lower(email), so an
+# address in a different case is the same account
+LowerCaseEmailStr = Annotated[EmailStr, AfterValidator(str.lower)]
 
 
 # Shared properties
 class UserBase(SQLModel):
-    email: EmailStr = Field(unique=True, index=True, max_length=255)
+    email: LowerCaseEmailStr = Field(max_length=255)
     is_active: bool = True
     is_superuser: bool = False
     full_name: str | None = Field(default=None, max_length=255)
@@ -18,20 +42,20 @@ class UserCreate(UserBase):
 
 
 class UserRegister(SQLModel):
-    email: EmailStr = Field(max_length=255)
+    email: LowerCaseEmailStr = Field(max_length=255)
     password: str = Field(min_length=8, max_length=128)
     full_name: str | None = Field(default=None, max_length=255)
 
 
 # Properties to receive via API on update, all are optional
 class UserUpdate(UserBase):
-    email: EmailStr | None = Field(default=None, max_length=255)  # type: ignore
+    email: LowerCaseEmailStr | None = Field(default=None, max_length=255)  # type: ignore
     password: str | None = Field(default=None, min_length=8, max_length=128)
 
 
 class UserUpdateMe(SQLModel):
     full_name: str | None = Field(default=None, max_length=255)
-    email: EmailStr | None = Field(default=None, max_length=255)
+    email: LowerCaseEmailStr | None = Field(default=None, max_length=255)
 
 
 class UpdatePassword(SQLModel):
@@ -41,9 +65,49 @@ class UpdatePassword(SQLModel):
 
 # Database model, database table inferred from class name
 class User(UserBase, table=True):
+    __table_args__ = (
+        # Unique regardless of case, see crud.user_by_email_statement
+        Index("ix_user_email_lower", text("lower(email)"), unique=True),
+        # Filters of GET /users/, see crud.users_filter
+        Index(
+            "ix_user_email_pattern",
+            "email",
+            postgresql_ops={"email": "varchar_pattern_ops"},
+        ),
+        Index(
+            "ix_user_email_trgm",
+            "email",
+            postgresql_using="gin",
+            postgresql_ops={"email": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_user_full_name_trgm",
+            "full_name",
+            postgresql_using="gin",
+            postgresql_ops={"full_name": "gin_trgm_ops"},
+        ),
+        # Few users are superusers or inactive, their pages come from these
+        # small indexes, in id order
+        Index("ix_user_superuser_id", "id", postgresql_where=text("is_superuser")),
+        Index("ix_user_inactive_id", "id", postgresql_where=text("NOT is_active")),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
-    items: list["Item"] = Relationship(back_populates="owner", cascade_delete=True)
+    # Bumped to revoke every access token issued to the user
+    token_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    # Bumped on every update of the user, and of any of their items, for ETags
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+    items_version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+    # Set when the user is deleted, the user is kept (inactive) until a
+    # background job has deleted their items, see crud.purge_user_async
+    deleted_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True))
+    )
+    # Deleted by the ON DELETE CASCADE of item.owner_id, without loading them
+    items: list["Item"] = Relationship(
+        back_populates="owner", cascade_delete=True, passive_deletes=True
+    )
 
 
 # Properties to return via API, id is always required
@@ -51,9 +115,20 @@ class UserPublic(UserBase):
     id: uuid.UUID
 
 
+# Fields of UserPublic that can be selected with ?fields=
+UserField = Literal["id", "email", "is_active", "is_superuser", "full_name"]
+
+
 class UsersPublic(SQLModel):
     data: list[UserPublic]
-    count: int
+    # None when the client asked not to count, and on pages after a cursor
+    count: int | None
+    has_more: bool = False
+    next_cursor: str | None = None
+
+
+# Orders the changes of items, with the id of the transaction that made them
+item_change_seq = Sequence("item_change_seq", metadata=SQLModel.metadata)
 
 
 # Shared properties
@@ -74,22 +149,200 @@ class ItemUpdate(ItemBase):
 
 # Database model, database table inferred from class name
 class Item(ItemBase, table=True):
+    __table_args__ = (
+        # Serves the owner scoped lists (filtered by owner, ordered by id),
+        # their counts and the lookups of the ON DELETE CASCADE from user
+        Index("ix_item_owner_id_id", "owner_id", "id"),
+        # Full text search document, computed by the database and not loaded
+        # with the items, see crud.search_items_async
+        Column(
+            "search_vector",
+            TSVECTOR,
+            Computed(
+                "setweight(to_tsvector('english'::regconfig, "
+                "coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector('english'::regconfig, "
+                "coalesce(description, '')), 'B')",
+                persisted=True,
+            ),
+        ),
+        Index("ix_item_search_vector", "search_vector", postgresql_using="gin"),
+        # Trigram matching of titles, for prefixes and typos
+        Index(
+            "ix_item_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+        # Change tracking for GET /items/changes, maintained by the database:
+        # set by the defaults on insert and by the item_changed trigger on
+        # update, and the item_deleted trigger leaves an ItemTombstone
+        Column(
+            "change_xid",
+            BigInteger,
+            nullable=False,
+            server_default=text("(pg_current_xact_id()::text)::bigint"),
+        ),
+        Column(
+            "change_seq",
+            BigInteger,
+            nullable=False,
+            server_default=text("nextval('item_change_seq')"),
+        ),
+        Column(
+            "created_at",
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=func.now(),
+        ),
+        Column(
+            "updated_at",
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=func.now(),
+        ),
+        Index("ix_item_owner_id_change", "owner_id", "change_xid", "change_seq"),
+        Index("ix_item_change", "change_xid", "change_seq"),
+    )
+    __mapper_args__ = {
+        "exclude_properties": [
+            "search_vector",
+            "change_xid",
+            "change_seq",
+            "created_at",
+            "updated_at",
+        ]
+    }
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     owner_id: uuid.UUID = Field(
         foreign_key="user.id", nullable=False, ondelete="CASCADE"
     )
+    # Bumped on every update, for ETags
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
     owner: User | None = Relationship(back_populates="items")
 
 
+# Left by the deletion of an item, for GET /items/changes
+class ItemTombstone(SQLModel, table=True):
+    __tablename__ = "item_tombstone"
+    __table_args__ = (
+        Index(
+            "ix_item_tombstone_owner_id_change", "owner_id", "change_xid", "change_seq"
+        ),
+        Index("ix_item_tombstone_change", "change_xid", "change_seq"),
+    )
+
+    id: uuid.UUID = Field(primary_key=True)
+    owner_id: uuid.UUID = Field(
+        foreign_key="user.id", nullable=False, ondelete="CASCADE"
+    )
+    change_xid: int = Field(sa_type=BigInteger)
+    change_seq: int = Field(sa_type=BigInteger)
+    deleted_at: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True), nullable=False, server_default=func.now()
+        )
+    )
+
+
+def bump_items_version(owner_ids: Collection[uuid.UUID]) -> Update:
+    """
+    Bump the items version of the owners of items inserted, updated or deleted
+    without the ORM, the ORM does it when flushing.
+    """
+    return (
+        update(User)
+        .where(col(User.id).in_(sorted(owner_ids)))
+        .values(items_version=col(User.items_version) + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+@event.listens_for(User, "before_update")
+@event.listens_for(Item, "before_update")
+def _bump_version(_mapper: Mapper[Any], connection: Connection, target: Any) -> None:
+    session = object_session(target)
+    if session is None or not session.is_modified(target, include_collections=False):
+        return
+    # Incremented by the database, the loaded value can be stale (e.g. the
+    # cached principal). The attribute is expired by the flush, and only read
+    # by the GET endpoints, from freshly loaded rows
+    target.version = col(type(target).version) + 1
+    if isinstance(target, Item):
+        connection.execute(bump_items_version([target.owner_id]))
+
+
+@event.listens_for(Item, "before_insert")
+@event.listens_for(Item, "before_delete")
+def _bump_owner_items_version(
+    _mapper: Mapper[Any], connection: Connection, target: Item
+) -> None:
+    connection.execute(bump_items_version([target.owner_id]))
+
+
 # Properties to return via API, id is always required
 class ItemPublic(ItemBase):
     id: uuid.UUID
     owner_id: uuid.UUID
 
 
+# Fields of ItemPublic that can be selected with ?fields=
+ItemField = Literal["id", "title", "description", "owner_id"]
+
+
+class ItemIdsPublic(SQLModel):
+    data: list[uuid.UUID]
+    count: int
+
+
+# Selects the items of a bulk update or delete, the criteria are combined with
+# AND, and there must be at least one
+class ItemsFilter(SQLModel):
+    ids: list[uuid.UUID] | None = None
+    title: str | None = None
+    owner_id: uuid.UUID | None = None
+
+    @model_validator(mode="after")
+    def _check_not_empty(self) -> Self:
+        if self.ids is None and self.title is None and self.owner_id is None:
+            raise ValueError("At least one of ids, title or owner_id is required")
+        return self
+
+
+class ItemsBulkUpdate(SQLModel):
+    filter: ItemsFilter
+    update: ItemUpdate
+
+
+class ItemsCount(SQLModel):
+    count: int
+
+
 class ItemsPublic(SQLModel):
     data: list[ItemPublic]
-    count: int
+    # None when the client asked not to count, and on pages after a cursor
+    count: int | None
+    has_more: bool = False
+    next_cursor: str | None = None
+
+
+# Changes since the last sync, pass next_cursor as since to the next one
+class ItemChangesPublic(SQLModel):
+    # Created or updated
+    data: list[ItemPublic]
+    # Ids of the deleted items
+    deleted: list[uuid.UUID]
+    has_more: bool
+    next_cursor: str
+
+
+# Progress of a long running job, see app.core.jobs
+class JobPublic(SQLModel):
+    id: uuid.UUID
+    status: str
+    progress: dict[str, int]
+    errors: list[dict[str, Any]]
 
 
 # Generic message
@@ -101,11 +354,32 @@ class Message(SQLModel):
 class Token(SQLModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: str | None = None
+
+
+class RefreshTokenRequest(SQLModel):
+    refresh_token: str
+
+
+# Only a SHA-256 digest of each refresh token is stored, a token can be used
+# once, using it deletes the row and issues a new one
+class RefreshToken(SQLModel, table=True):
+    token_hash: bytes = Field(primary_key=True)
+    user_id: uuid.UUID = Field(
+        foreign_key="user.id", nullable=False, ondelete="CASCADE", index=True
+    )
+    token_version: int
+    expires_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False, index=True)
+    )
 
 
 # Contents of JWT token
 class TokenPayload(SQLModel):
     sub: str | None = None
+    is_superuser: bool = False
+    is_active: bool = False
+    token_version: int | None = None
 
 
 class NewPassword(SQLModel):
@@ -0,0 +1,99 @@
+"""
+Throughput and memory per in-flight request of the blocking stack (a
+threadpool running `Session` queries, what sync FastAPI endpoints do) against
+the async stack (`AsyncSession` on the event loop).
+
+Each request runs a small query plus `pg_sleep` to stand in for the database
+latency. Needs the database from the docker compose stack, run from the
+backend directory:
+
+    python -m benchmarks.bench_async_db
+
+Memory is the Python heap peak (tracemalloc) while all the requests are in
+flight, divided by the concurrency. Thread stacks are not Python allocations,
+so the threadpool numbers are a lower bound.
+"""
+
+import asyncio
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from sqlalchemy import func, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import User
+
+CONCURRENCY = 40
+REQUESTS = 2_000
+LATENCY_SECONDS = 0.005
+SLEEP = text(f"SELECT pg_sleep({LATENCY_SECONDS})")
+
+
+def _engine_options() -> dict[str, Any]:
+    # One connection per in-flight request, so the pool isn't the bottleneck
+    return {"pool_size": CONCURRENCY, "max_overflow": 0}
+
+
+def run_sync() -> tuple[float, float]:
+    engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), **_engine_options())
+
+    def worker(requests: int) -> None:
+        for _ in range(requests):
+            with Session(engine) as session:
+                session.exec(select(func.count()).select_from(User)).one()
+                session.execute(SLEEP)
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        # Warm up the pool and the threads
+        list(executor.map(worker, [1] * CONCURRENCY))
+        tracemalloc.start()
+        start = time.perf_counter()
+        list(executor.map(worker, [REQUESTS // CONCURRENCY] * CONCURRENCY))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    engine.dispose()
+    return REQUESTS / elapsed, peak / CONCURRENCY
+
+
+async def run_async() -> tuple[float, float]:
+    engine = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), **_engine_options()
+    )
+
+    async def worker(requests: int) -> None:
+        for _ in range(requests):
+            async with AsyncSession(engine) as session:
+                (await session.exec(select(func.count()).select_from(User))).one()
+                await session.execute(SLEEP)
+
+    await asyncio.gather(*(worker(1) for _ in range(CONCURRENCY)))
+    tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(REQUESTS // CONCURRENCY) for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await engine.dispose()
+    return REQUESTS / elapsed, peak / CONCURRENCY
+
+
+def main() -> None:
+    print(f"{REQUESTS} requests, {CONCURRENCY} in flight, {LATENCY_SECONDS}s latency")
+    for name, (throughput, memory) in (
+        ("threadpool + Session", run_sync()),
+        ("asyncio + AsyncSession", asyncio.run(run_async())),
+    ):
+        print(
+            f"{name:24} {throughput:8.1f} requests/s "
+            f"{memory / 1024:8.1f} KiB/in-flight request"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Latency and throughput of creating items one at a time, as POST /items/ does,
+against crud.create_items_async (POST /items/bulk) with batches of different
+sizes.
+
+Creates a throwaway user and deletes it with its items at the end. Needs the
+database from the docker compose stack, run from the backend directory:
+
+    python -m benchmarks.bench_bulk_insert
+"""
+
+import asyncio
+import time
+import uuid
+
+from sqlmodel import Session, col, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.core.db import async_engine, engine
+from app.models import Item, ItemCreate, User
+
+ROWS = 20_000
+SINGLE_ROWS = 1_000
+BATCH_SIZES = (100, 1_000, 10_000)
+
+
+def print_result(name: str, batch_size: int, rows: int, elapsed: float) -> None:
+    batch_ms = elapsed / (rows / batch_size) * 1000
+    print(
+        f"{name:12} {batch_size:6} {batch_ms:10.2f} ms/batch {rows / elapsed:10.0f} rows/s"
+    )
+
+
+async def run(owner_id: uuid.UUID) -> None:
+    items_in = [
+        ItemCreate(title=f"item {i}", description="benchmark") for i in range(ROWS)
+    ]
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        start = time.perf_counter()
+        for item_in in items_in[:SINGLE_ROWS]:
+            await crud.create_item_async(
+                session=session, item_in=item_in, owner_id=owner_id
+            )
+        print_result("POST /items/", 1, SINGLE_ROWS, time.perf_counter() - start)
+        for batch_size in BATCH_SIZES:
+            start = time.perf_counter()
+            for i in range(0, ROWS, batch_size):
+                await crud.create_items_async(
+                    session=session,
+                    items_in=items_in[i : i + batch_size],
+                    owner_id=owner_id,
+                )
+            print_result("bulk", batch_size, ROWS, time.perf_counter() - start)
+    await async_engine.dispose()
+
+
+def main() -> None:
+    with Session(engine) as session:
+        user = User(
+            email=f"bench-{uuid.uuid4()}@example.com", hashed_password="not used"
+        )
+        session.add(user)
+        session.commit()
+        user_id = user.id
+    try:
+        asyncio.run(run(user_id))
+    finally:
+        with Session(engine) as session:
+            session.execute(delete(Item).where(col(Item.owner_id) == user_id))
+            session.execute(delete(User).where(col(User.id) == user_id))
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Latency of the first page of GET /items/ (as a superuser) with a separate
+COUNT(*) query, as it used to be, and with each count strategy of
+app.core.pagination.paginate, on the first page and on a page after a cursor
+deep into the items.
+
+Inserts 10M items for a throwaway user, and deletes them at the end. Needs the
+database from the docker compose stack, run from the backend directory:
+
+    python -m benchmarks.bench_count_strategies
+"""
+
+import asyncio
+import statistics
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from functools import partial
+
+from sqlalchemy import text
+from sqlmodel import Session, col, delete, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.db import async_engine, engine
+from app.core.pagination import CountStrategy, paginate
+from app.models import Item, User
+
+ROWS = 10_000_000
+PAGE_SIZE = 100
+REPEAT = 10
+COUNT_STRATEGIES: tuple[CountStrategy, ...] = ("exact", "estimated", "none")
+# The deep cursor is the id of this row, in id order
+DEEP_OFFSET = ROWS * 9 // 10
+
+
+async def count_then_page(session: AsyncSession) -> None:
+    (await session.exec(select(func.count()).select_from(Item))).one()
+    statement = select(Item).order_by(col(Item.id)).limit(PAGE_SIZE)
+    (await session.exec(statement)).all()
+
+
+async def median_ms(fn: Callable[[], Awaitable[object]]) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+async def run() -> dict[str, float]:
+    async with AsyncSession(async_engine) as session:
+        results = {"COUNT(*) + page": await median_ms(lambda: count_then_page(session))}
+        statement = select(Item.id).order_by(col(Item.id)).offset(DEEP_OFFSET)
+        deep_cursor_id = (await session.exec(statement.limit(1))).one()
+        for name, cursor_id in [("first", None), ("deep", deep_cursor_id)]:
+            for count in COUNT_STRATEGIES:
+                page = partial(
+                    paginate,
+                    session,
+                    Item,
+                    cursor_id=cursor_id,
+                    skip=0,
+                    limit=PAGE_SIZE,
+                    count=count,
+                )
+                results[f"{count}, {name}"] = await median_ms(page)
+    await async_engine.dispose()
+    return results
+
+
+def main() -> None:
+    with Session(engine) as session:
+        user = User(
+            email=f"bench-{uuid.uuid4()}@example.com", hashed_password="not used"
+        )
+        session.add(user)
+        session.commit()
+        user_id = user.id
+        session.execute(
+            text(
+                "INSERT INTO item (id, title, owner_id) "
+                "SELECT gen_random_uuid(), 'item ' || n, :owner_id "
+                "FROM generate_series(1, :rows) AS n"
+            ),
+            {"owner_id": user_id, "rows": ROWS},
+        )
+        session.commit()
+        session.execute(text("ANALYZE item"))
+        session.commit()
+    try:
+        results = asyncio.run(run())
+    finally:
+        with Session(engine) as session:
+            session.execute(delete(Item).where(col(Item.owner_id) == user_id))
+            session.execute(delete(User).where(col(User.id) == user_id))
+            session.commit()
+    print(f"{ROWS:,} items, pages of {PAGE_SIZE}, deep cursor at {DEEP_OFFSET:,}")
+    for name, ms in results.items():
+        print(f"{name:18} {ms:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
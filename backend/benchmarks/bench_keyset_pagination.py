@@ -0,0 +1,98 @@
+"""
+Latency of the first and of the 10,000th page of GET /items/ (as a superuser),
+with offset and with keyset (cursor) pagination, through
+app.core.pagination.paginate with the defaults of the endpoint (an exact
+count).
+
+Inserts 1M items for a throwaway user, and deletes them at the end. Needs the
+database from the docker compose stack, run from the backend directory:
+
+    python -m benchmarks.bench_keyset_pagination
+"""
+
+import asyncio
+import statistics
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from functools import partial
+
+from sqlalchemy import text
+from sqlmodel import Session, col, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.db import async_engine, engine
+from app.core.pagination import paginate
+from app.models import Item, User
+
+PAGE_SIZE = 100
+PAGES = 10_000
+REPEAT = 20
+
+
+async def median_ms(fn: Callable[[], Awaitable[object]]) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+async def run() -> dict[str, float]:
+    async with AsyncSession(async_engine) as session:
+        # Cursor of the last row of page 9,999
+        statement = (
+            select(Item.id)
+            .order_by(col(Item.id))
+            .offset((PAGES - 1) * PAGE_SIZE - 1)
+            .limit(1)
+        )
+        last_id = (await session.exec(statement)).one()
+        page = partial(paginate, session, Item, limit=PAGE_SIZE, count="exact")
+        results = {
+            # The first page is the same for both, and the only one counted
+            "page 1": await median_ms(lambda: page(cursor_id=None, skip=0)),
+            f"offset, page {PAGES:,}": await median_ms(
+                lambda: page(cursor_id=None, skip=(PAGES - 1) * PAGE_SIZE)
+            ),
+            f"keyset, page {PAGES:,}": await median_ms(
+                lambda: page(cursor_id=last_id, skip=0)
+            ),
+        }
+    await async_engine.dispose()
+    return results
+
+
+def main() -> None:
+    with Session(engine) as session:
+        user = User(
+            email=f"bench-{uuid.uuid4()}@example.com", hashed_password="not used"
+        )
+        session.add(user)
+        session.commit()
+        user_id = user.id
+        session.execute(
+            text(
+                "INSERT INTO item (id, title, owner_id) "
+                "SELECT gen_random_uuid(), 'item ' || n, :owner_id "
+                "FROM generate_series(1, :rows) AS n"
+            ),
+            {"owner_id": user_id, "rows": PAGE_SIZE * PAGES},
+        )
+        session.commit()
+        session.execute(text("ANALYZE item"))
+        session.commit()
+    try:
+        results = asyncio.run(run())
+    finally:
+        with Session(engine) as session:
+            session.execute(delete(Item).where(col(Item.owner_id) == user_id))
+            session.execute(delete(User).where(col(User.id) == user_id))
+            session.commit()
+    for name, ms in results.items():
+        print(f"{name:20} {ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Latency of GET /items/search (as a superuser) for a rare and a common word,
+deeper pages of the common word, and a misspelled word that falls back to
+trigram matching, against a substring match with ILIKE.
+
+Inserts 3M items with titles and descriptions drawn from a vocabulary, some
+words being much more frequent than others, for a throwaway user, and deletes
+them at the end. Needs the database from the docker compose stack, run from
+the backend directory:
+
+    python -m benchmarks.bench_search
+"""
+
+import random
+import statistics
+import string
+import time
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+from sqlalchemy import text
+from sqlmodel import Session, col, delete, select
+
+from app import crud
+from app.core.db import engine
+from app.models import Item, User
+
+ROWS = 3_000_000
+VOCABULARY_SIZE = 20_000
+PAGE_SIZE = 100
+PAGES = 10
+REPEAT = 20
+
+
+def search_page(
+    session: Session,
+    query: str,
+    mode: crud.ItemSearchMode,
+    after: tuple[float, uuid.UUID] | None = None,
+) -> list[Any]:
+    statement = crud.search_items_statement(
+        query=query, mode=mode, owner_id=None, after=after, limit=PAGE_SIZE + 1
+    )
+    return list(session.execute(statement).all())
+
+
+def ilike_page(session: Session, query: str) -> list[Item]:
+    statement = (
+        select(Item)
+        .where(col(Item.title).ilike(f"%{query}%"))
+        .order_by(col(Item.id))
+        .limit(PAGE_SIZE + 1)
+    )
+    return list(session.exec(statement).all())
+
+
+def median_ms(fn: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main() -> None:
+    words = [
+        "".join(random.choices(string.ascii_lowercase, k=8))
+        for _ in range(VOCABULARY_SIZE)
+    ]
+    # Words are drawn with random()^3, the first ones are the most frequent
+    common_word, rare_word = words[0], words[-1]
+    misspelled = rare_word[:4] + "x" + rare_word[5:]
+    with Session(engine) as session:
+        user = User(
+            email=f"bench-{uuid.uuid4()}@example.com", hashed_password="not used"
+        )
+        session.add(user)
+        session.commit()
+        session.execute(
+            text(
+                "WITH vocabulary AS (SELECT CAST(:words AS text[]) AS w) "
+                "INSERT INTO item (id, title, description, owner_id) "
+                "SELECT gen_random_uuid(), "
+                "concat_ws(' ', w[1 + floor(random() ^ 3 * :size)::int], "
+                "w[1 + floor(random() ^ 3 * :size)::int], "
+                "w[1 + floor(random() ^ 3 * :size)::int]), "
+                "concat_ws(' ', w[1 + floor(random() ^ 3 * :size)::int], "
+                "w[1 + floor(random() ^ 3 * :size)::int], "
+                "w[1 + floor(random() ^ 3 * :size)::int], "
+                "w[1 + floor(random() ^ 3 * :size)::int]), "
+                ":owner_id "
+                "FROM vocabulary, generate_series(1, :rows)"
+            ),
+            {
+                "owner_id": user.id,
+                "rows": ROWS,
+                "size": VOCABULARY_SIZE,
+                "words": words,
+            },
+        )
+        session.commit()
+        session.execute(text("ANALYZE item"))
+        try:
+            # Cursor of the last item before the last page
+            after: tuple[float, uuid.UUID] | None = None
+            for _ in range(PAGES - 1):
+                item, rank = search_page(session, common_word, "fulltext", after)[
+                    PAGE_SIZE - 1
+                ]
+                after = (rank, item.id)
+            results = {
+                "fulltext, rare word": median_ms(
+                    lambda: search_page(session, rare_word, "fulltext")
+                ),
+                "fulltext, common word": median_ms(
+                    lambda: search_page(session, common_word, "fulltext")
+                ),
+                f"fulltext, common word, page {PAGES}": median_ms(
+                    lambda: search_page(session, common_word, "fulltext", after)
+                ),
+                "trigram, misspelled word": median_ms(
+                    lambda: search_page(session, misspelled, "trigram")
+                ),
+                "ILIKE, rare word": median_ms(lambda: ilike_page(session, rare_word)),
+            }
+        finally:
+            session.rollback()
+            session.execute(delete(Item).where(col(Item.owner_id) == user.id))
+            session.execute(delete(User).where(col(User.id) == user.id))
+            session.commit()
+    for name, ms in results.items():
+        print(f"{name:32} {ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Latency of the filters of GET /users/ (a page of 100 users, without counting
+them) with 5M users: an email prefix, a part of an email and of a full name,
+inactive users and superusers. Each one should take less than 10 ms.
+
+Inserts 5M users with emails and full names drawn from a vocabulary, one in
+1000 being inactive and one in 100,000 a superuser, and deletes them at the
+end. Needs the database from the docker compose stack, run from the backend
+directory:
+
+    python -m benchmarks.bench_user_search
+"""
+
+import random
+import statistics
+import string
+import time
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+from sqlalchemy import text
+from sqlmodel import Session, col, delete, select
+
+from app import crud
+from app.core.db import engine
+from app.models import User
+
+ROWS = 5_000_000
+VOCABULARY_SIZE = 20_000
+PAGE_SIZE = 100
+REPEAT = 20
+
+
+def filter_page(session: Session, **filters: Any) -> list[User]:
+    statement = (
+        select(User)
+        .where(*crud.users_filter(**filters))
+        .order_by(col(User.id))
+        .limit(PAGE_SIZE + 1)
+    )
+    return list(session.exec(statement).all())
+
+
+def median_ms(fn: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main() -> None:
+    words = [
+        "".join(random.choices(string.ascii_lowercase, k=8))
+        for _ in range(VOCABULARY_SIZE)
+    ]
+    # Emails of this run start with the prefix, to delete them at the end
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+    with Session(engine) as session:
+        session.execute(
+            text(
+                "WITH vocabulary AS (SELECT CAST(:words AS text[]) AS w) "
+                'INSERT INTO "user" '
+                "(id, email, full_name, hashed_password, is_active, is_superuser) "
+                "SELECT gen_random_uuid(), "
+                ":prefix || w[1 + i % :size] || '.' || i || '@example.com', "
+                "concat_ws(' ', w[1 + floor(random() * :size)::int], "
+                "w[1 + floor(random() * :size)::int]), "
+                "'not used', i % 1000 <> 0, i % 100000 = 0 "
+                "FROM vocabulary, generate_series(1, :rows) AS i"
+            ),
+            {"prefix": prefix, "rows": ROWS, "size": VOCABULARY_SIZE, "words": words},
+        )
+        session.commit()
+        session.execute(text('ANALYZE "user"'))
+        try:
+            # The emails of user 12345, and of the users with its word
+            word = words[12345 % VOCABULARY_SIZE]
+            results = {
+                "email prefix, one user": median_ms(
+                    lambda: filter_page(session, email_prefix=f"{prefix}{word}.12345@")
+                ),
+                "email contains, one user": median_ms(
+                    lambda: filter_page(session, email_contains=f"{word}.12345@")
+                ),
+                "email contains, a word": median_ms(
+                    lambda: filter_page(session, email_contains=word)
+                ),
+                "full name contains, a word": median_ms(
+                    lambda: filter_page(session, full_name_contains=words[-1])
+                ),
+                "inactive": median_ms(lambda: filter_page(session, is_active=False)),
+                "superusers": median_ms(
+                    lambda: filter_page(session, is_superuser=True)
+                ),
+            }
+        finally:
+            session.rollback()
+            session.execute(delete(User).where(col(User.email).startswith(prefix)))
+            session.commit()
+    for name, ms in results.items():
+        print(f"{name:32} {ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,54 @@
+import asyncio
+import csv
+import io
+import json
+import resource
 import uuid
+from collections.abc import Generator
+from typing import get_args
 
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, col, delete, select
 
+from app import crud
+from app.api.deps import READ_YOUR_WRITES_COOKIE
+from app.api.routes.items import _export_items
+from app.core.cache import invalidate_principal, principal_cache
 from app.core.config import settings
+from app.core.db import async_engine, replica_engines
+from app.core.pagination import encode_cursor
+from app.models import Item, ItemCreate, ItemField, ItemPublic, UserCreate
 from tests.utils.item import create_random_item
+from tests.utils.user import create_random_user, user_authentication_headers
+from tests.utils.utils import (
+    random_email,
+    random_lower_string,
+    recorded_statements,
+)
+
+
+@pytest.fixture
+def replica_connections(client: TestClient) -> Generator[list[object], None, None]:
+    """
+    Route reads to a second engine on the primary, standing in for a replica,
+    and record the connections it hands out.
+    """
+    replica_engine = create_async_engine(async_engine.url, poolclass=NullPool)
+    connections: list[object] = []
+    event.listen(
+        replica_engine.sync_engine,
+        "checkout",
+        lambda dbapi_connection, *_args: connections.append(dbapi_connection),
+    )
+    client.cookies.clear()
+    replica_engines.append(replica_engine)
+    yield connections
+    replica_engines.remove(replica_engine)
+    client.cookies.clear()
 
 
 def test_create_item(
@@ -24,6 +68,297 @@ def test_create_item(
     assert "owner_id" in content
 
 
+def test_item_writes_statements(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    # Authenticate once, so the principal is cached
+    client.get(f"{settings.API_V1_STR}/items/", headers=superuser_token_headers)
+    with recorded_statements() as statements:
+        response = client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=superuser_token_headers,
+            json={"title": "Foo"},
+        )
+    assert response.status_code == 200
+    # Bump of the owner's items version and the insert, nothing read back
+    assert statements == ["UPDATE", "INSERT"]
+
+    with recorded_statements() as statements:
+        response = client.put(
+            f"{settings.API_V1_STR}/items/{response.json()['id']}",
+            headers=superuser_token_headers,
+            json={"title": "Bar"},
+        )
+    assert response.status_code == 200
+    assert response.json()["title"] == "Bar"
+    # The item to check permissions, then the writes
+    assert statements == ["SELECT", "UPDATE", "UPDATE"]
+
+
+def test_create_items_bulk(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    data = [{"title": f"Foo {i}", "description": "Bar"} for i in range(3)]
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["count"] == 3
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user
+    for item_id, item_in in zip(content["data"], data, strict=True):
+        item = db.get(Item, uuid.UUID(item_id))
+        assert item
+        assert item.title == item_in["title"]
+        assert item.owner_id == user.id
+
+
+def test_create_items_bulk_empty(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json=[],
+    )
+    assert response.status_code == 422
+
+
+def test_update_items_bulk(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user
+    own_items = [
+        crud.create_item(session=db, item_in=ItemCreate(title="Foo"), owner_id=user.id)
+        for _ in range(2)
+    ]
+    other_item = create_random_item(db)
+    response = client.patch(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json={
+            "filter": {"ids": [str(item.id) for item in [*own_items, other_item]]},
+            "update": {"description": "Updated"},
+        },
+    )
+    assert response.status_code == 200
+    assert response.json() == {"count": 2}
+    for item in own_items:
+        db.refresh(item)
+        assert item.description == "Updated"
+    db.refresh(other_item)
+    assert other_item.description != "Updated"
+
+
+def test_update_items_bulk_nothing_to_update(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.patch(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json={"filter": {"title": "Foo"}, "update": {}},
+    )
+    assert response.status_code == 400
+
+
+def test_delete_items_bulk(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user
+    title = random_lower_string()
+    for _ in range(3):
+        crud.create_item(session=db, item_in=ItemCreate(title=title), owner_id=user.id)
+    other_item = create_random_item(db)
+    other_item.title = title
+    db.add(other_item)
+    db.commit()
+    response = client.request(
+        "DELETE",
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json={"title": title},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"count": 3}
+    db.expire_all()
+    assert db.get(Item, other_item.id)
+
+
+def test_delete_items_bulk_superuser(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    items = [create_random_item(db) for _ in range(2)]
+    response = client.request(
+        "DELETE",
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=superuser_token_headers,
+        json={"ids": [str(item.id) for item in items]},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"count": 2}
+
+
+def test_delete_items_bulk_empty_filter(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.request(
+        "DELETE",
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=superuser_token_headers,
+        json={},
+    )
+    assert response.status_code == 422
+
+
+def test_export_items(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+    items = [
+        crud.create_item(
+            session=db,
+            item_in=ItemCreate(title=f"Foo, {i}", description=None if i else "Bar"),
+            owner_id=user.id,
+        )
+        for i in range(3)
+    ]
+    create_random_item(db)
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    expected = [
+        {
+            "id": str(item.id),
+            "title": item.title,
+            "description": item.description,
+            "owner_id": str(item.owner_id),
+        }
+        for item in sorted(items, key=lambda item: str(item.id))
+    ]
+
+    response = client.get(f"{settings.API_V1_STR}/items/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == expected
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export",
+        headers=headers,
+        params={"format": "csv"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert rows == [
+        {**item, "description": item["description"] or ""} for item in expected
+    ]
+
+
+def test_export_items_constant_memory(db: Session) -> None:
+    rows = 1_000_000
+    user = create_random_user(db)
+    db.execute(
+        text(
+            "INSERT INTO item (id, title, description, owner_id) "
+            "SELECT gen_random_uuid(), 'item ' || n, repeat('x', 100), :owner_id "
+            "FROM generate_series(1, :rows) AS n"
+        ),
+        {"owner_id": user.id, "rows": rows},
+    )
+    db.commit()
+
+    # The test client buffers whole responses, consume the body generator of
+    # the endpoint instead
+    async def export() -> int:
+        exported = 0
+        async for chunk in _export_items(async_engine, user.id, "ndjson"):
+            exported += chunk.count("\n")
+        await async_engine.dispose()
+        return exported
+
+    # Peak RSS of the process in KiB, materializing the rows would take
+    # several hundred MiB
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert asyncio.run(export()) == rows
+    assert resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - max_rss < 100 * 1024
+    db.execute(delete(Item).where(col(Item.owner_id) == user.id))
+    db.commit()
+
+
+def test_import_items(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    body = "\n".join(
+        [
+            json.dumps({"title": "Foo", "description": "Bar"}),
+            json.dumps({"title": "x" * 256}),
+            json.dumps({"title": "Baz"}),
+        ]
+    )
+    response = client.post(
+        f"{settings.API_V1_STR}/items/import",
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+        content=body,
+    )
+    assert response.status_code == 200
+    job = response.json()
+    assert job["status"] == "succeeded"
+    assert job["progress"] == {"read": 3, "rejected": 1, "imported": 2}
+    assert [error["line"] for error in job["errors"]] == [2]
+    items = db.exec(select(Item).where(Item.owner_id == user.id)).all()
+    assert sorted(item.title for item in items) == ["Baz", "Foo"]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/import/{job['id']}", headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json() == job
+
+
+def test_import_items_csv(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/import",
+        headers={**normal_user_token_headers, "Content-Type": "text/csv"},
+        params={"format": "csv"},
+        content='title,description\nFoo,"multi\nline"\n,missing title\n',
+    )
+    assert response.status_code == 200
+    job = response.json()
+    assert job["progress"]["imported"] == 1
+    assert job["errors"][0]["line"] == 4
+
+
+def test_read_import_job_not_owner(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/import",
+        headers=superuser_token_headers,
+        content=json.dumps({"title": "Foo"}),
+    )
+    job_id = response.json()["id"]
+    response = client.get(
+        f"{settings.API_V1_STR}/items/import/{job_id}",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 404
+
+
 def test_read_item(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -40,6 +375,34 @@ def test_read_item(
     assert content["owner_id"] == str(item.owner_id)
 
 
+def test_read_item_etag(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    response = client.get(url, headers=superuser_token_headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+
+    for if_none_match in [etag, etag.removeprefix("W/"), f'W/"other", {etag}', "*"]:
+        response = client.get(
+            url, headers={**superuser_token_headers, "If-None-Match": if_none_match}
+        )
+        assert response.status_code == 304, if_none_match
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    response = client.put(url, headers=superuser_token_headers, json={"title": "Foo"})
+    assert response.status_code == 200
+    response = client.get(
+        url, headers={**superuser_token_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["title"] == "Foo"
+    assert response.headers["etag"] != etag
+
+
 def test_read_item_not_found(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -79,6 +442,385 @@ def test_read_items(
     assert len(content["data"]) >= 2
 
 
+def test_read_items_cursor(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+    item_ids = sorted(
+        str(
+            crud.create_item(
+                session=db, item_in=ItemCreate(title="Foo"), owner_id=user.id
+            ).id
+        )
+        for _ in range(5)
+    )
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    read_ids: list[str] = []
+    params = {"limit": 2}
+    while True:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/", headers=headers, params=params
+        )
+        assert response.status_code == 200
+        content = response.json()
+        # Only the first page is counted
+        assert content["count"] == (None if "cursor" in params else 5)
+        read_ids += [item["id"] for item in content["data"]]
+        if not content["next_cursor"]:
+            break
+        params = {"limit": 2, "cursor": content["next_cursor"]}
+    assert read_ids == item_ids
+
+
+def test_read_items_count_strategies(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+    for _ in range(3):
+        crud.create_item(session=db, item_in=ItemCreate(title="Foo"), owner_id=user.id)
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    for params, count, has_more in [
+        ({"limit": 2}, 3, True),
+        ({"limit": 3}, 3, False),
+        ({"limit": 2, "skip": 10}, 3, False),
+        # Not a superuser, gets the exact count
+        ({"limit": 2, "count": "estimated"}, 3, True),
+        ({"limit": 2, "count": "none"}, None, True),
+        ({"limit": 2, "skip": 2, "count": "none"}, None, False),
+    ]:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/", headers=headers, params=params
+        )
+        assert response.status_code == 200
+        content = response.json()
+        assert content["count"] == count, params
+        assert content["has_more"] == has_more, params
+        assert (content["next_cursor"] is not None) == has_more, params
+
+
+def test_read_items_etag(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+    item = crud.create_item(
+        session=db, item_in=ItemCreate(title="Foo"), owner_id=user.id
+    )
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    url = f"{settings.API_V1_STR}/items/"
+
+    def get_items(etag: str) -> tuple[int, str]:
+        response = client.get(url, headers={**headers, "If-None-Match": etag})
+        return response.status_code, response.headers["etag"]
+
+    status_code, etag = get_items("")
+    assert status_code == 200
+    assert get_items(etag) == (304, etag)
+
+    # Items of other owners don't change the ETag
+    create_random_item(db)
+    assert get_items(etag) == (304, etag)
+
+    for method, path, json_body in [
+        ("POST", "bulk", [{"title": "Bar"}]),
+        ("PATCH", "bulk", {"filter": {"title": "Bar"}, "update": {"title": "Baz"}}),
+        ("PUT", str(item.id), {"title": "Qux"}),
+        ("DELETE", str(item.id), None),
+    ]:
+        response = client.request(
+            method, f"{url}{path}", headers=headers, json=json_body
+        )
+        assert response.status_code == 200, (method, path)
+        status_code, new_etag = get_items(etag)
+        assert status_code == 200, (method, path)
+        assert new_etag != etag, (method, path)
+        etag = new_etag
+
+
+def test_read_items_superuser_no_etag(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/", headers=superuser_token_headers
+    )
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+
+
+def test_read_items_fields(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+    items = sorted(
+        (
+            crud.create_item(
+                session=db,
+                item_in=ItemCreate(title=f"Foo {i}", description="Bar"),
+                owner_id=user.id,
+            )
+            for i in range(3)
+        ),
+        key=lambda item: str(item.id),
+    )
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    for count in ["exact", "none"]:
+        read: list[dict[str, str]] = []
+        params: dict[str, str | int] = {
+            "fields": "title,id",
+            "limit": 2,
+            "count": count,
+        }
+        while True:
+            response = client.get(
+                f"{settings.API_V1_STR}/items/", headers=headers, params=params
+            )
+            assert response.status_code == 200
+            content = response.json()
+            first_page = "cursor" not in params
+            assert content["count"] == (3 if count == "exact" and first_page else None)
+            read += content["data"]
+            if not content["next_cursor"]:
+                break
+            params["cursor"] = content["next_cursor"]
+        assert read == [{"title": item.title, "id": str(item.id)} for item in items]
+
+    # Without the id, pages still have a cursor
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=headers,
+        params={"fields": "description", "limit": 2},
+    )
+    content = response.json()
+    assert content["data"] == [{"description": "Bar"}, {"description": "Bar"}]
+    assert content["next_cursor"]
+    assert response.headers["etag"]
+
+
+def test_read_items_unknown_field(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"fields": "id,hashed_password"},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["query", "fields", 1]
+
+
+def test_item_fields_are_public() -> None:
+    assert set(get_args(ItemField)) == set(ItemPublic.model_fields)
+
+
+def test_read_items_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"cursor": "not a cursor"},
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_search_items(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+    word = random_lower_string()[:12]
+    in_title = crud.create_item(
+        session=db, item_in=ItemCreate(title=f"The {word} list"), owner_id=user.id
+    )
+    in_description = crud.create_item(
+        session=db,
+        item_in=ItemCreate(title="Groceries", description=f"Bought a {word}"),
+        owner_id=user.id,
+    )
+    crud.create_item(session=db, item_in=ItemCreate(title="Other"), owner_id=user.id)
+    # Same word, another owner
+    other_user = create_random_user(db)
+    crud.create_item(session=db, item_in=ItemCreate(title=word), owner_id=other_user.id)
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    response = client.get(
+        f"{settings.API_V1_STR}/items/search", headers=headers, params={"q": word}
+    )
+    assert response.status_code == 200
+    content = response.json()
+    # Title matches rank first
+    assert [item["id"] for item in content["data"]] == [
+        str(in_title.id),
+        str(in_description.id),
+    ]
+    assert content["count"] is None
+    assert content["has_more"] is False
+    assert content["next_cursor"] is None
+
+
+def test_search_items_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = create_random_user(db)
+    word = random_lower_string()[:12]
+    # Items with the same rank are ordered by id
+    item_ids = sorted(
+        str(
+            crud.create_item(
+                session=db, item_in=ItemCreate(title=word), owner_id=user.id
+            ).id
+        )
+        for _ in range(5)
+    )
+    item_ids.insert(
+        0,
+        str(
+            crud.create_item(
+                session=db, item_in=ItemCreate(title=f"{word} {word}"), owner_id=user.id
+            ).id
+        ),
+    )
+    read_ids: list[str] = []
+    params = {"q": word, "limit": 2}
+    while True:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/search",
+            headers=superuser_token_headers,
+            params=params,
+        )
+        assert response.status_code == 200
+        content = response.json()
+        read_ids += [item["id"] for item in content["data"]]
+        assert (content["next_cursor"] is not None) == content["has_more"]
+        if not content["next_cursor"]:
+            break
+        params = {"q": word, "limit": 2, "cursor": content["next_cursor"]}
+    assert read_ids == item_ids
+
+
+def test_search_items_similar_titles(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = create_random_user(db)
+    word = random_lower_string()[:12]
+    item = crud.create_item(
+        session=db, item_in=ItemCreate(title=f"{word} notes"), owner_id=user.id
+    )
+    # A prefix and a typo don't match as words, but the titles are similar
+    for q in [word[:8], word[:6] + "x" + word[7:]]:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/search",
+            headers=superuser_token_headers,
+            params={"q": q},
+        )
+        assert response.status_code == 200
+        content = response.json()
+        assert [i["id"] for i in content["data"]] == [str(item.id)], q
+
+
+def test_search_items_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    for cursor in ["not a cursor", encode_cursor("regex", 0.5, str(uuid.uuid4()))]:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/search",
+            headers=superuser_token_headers,
+            params={"q": "foo", "cursor": cursor},
+        )
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_read_item_changes(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+    # Ids only, the objects are expired by the commits below and the second
+    # one can't be refreshed once deleted
+    first_id, second_id = (
+        str(
+            crud.create_item(
+                session=db, item_in=ItemCreate(title="Foo"), owner_id=user.id
+            ).id
+        )
+        for _ in range(2)
+    )
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    url = f"{settings.API_V1_STR}/items/changes"
+
+    # Initial sync, one change at a time
+    synced: list[str] = []
+    params: dict[str, str | int] = {"limit": 1}
+    while True:
+        response = client.get(url, headers=headers, params=params)
+        assert response.status_code == 200
+        content = response.json()
+        assert content["deleted"] == []
+        synced += [item["id"] for item in content["data"]]
+        params["since"] = content["next_cursor"]
+        if not content["has_more"]:
+            break
+    assert synced == [first_id, second_id]
+
+    client.put(
+        f"{settings.API_V1_STR}/items/{first_id}",
+        headers=headers,
+        json={"title": "Bar"},
+    )
+    client.delete(f"{settings.API_V1_STR}/items/{second_id}", headers=headers)
+    third = client.post(
+        f"{settings.API_V1_STR}/items/", headers=headers, json={"title": "Baz"}
+    ).json()
+    # Not a change of this user
+    create_random_item(db)
+
+    response = client.get(url, headers=headers, params={"since": params["since"]})
+    content = response.json()
+    assert [(item["id"], item["title"]) for item in content["data"]] == [
+        (first_id, "Bar"),
+        (third["id"], "Baz"),
+    ]
+    assert content["deleted"] == [second_id]
+    assert content["has_more"] is False
+
+    # Nothing changed since
+    cursor = content["next_cursor"]
+    response = client.get(url, headers=headers, params={"since": cursor})
+    content = response.json()
+    assert content["data"] == []
+    assert content["deleted"] == []
+    assert content["next_cursor"] == cursor
+
+
+def test_read_item_changes_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    for since in ["not a cursor", encode_cursor("1", 2)]:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/changes",
+            headers=superuser_token_headers,
+            params={"since": since},
+        )
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid cursor"}
+
+
 def test_update_item(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -162,3 +904,55 @@ def test_delete_item_not_enough_permissions(
     assert response.status_code == 400
     content = response.json()
     assert content["detail"] == "Not enough permissions"
+
+
+def test_read_items_from_replica(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    replica_connections: list[object],
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/", headers=superuser_token_headers
+    )
+    assert response.status_code == 200
+    assert len(replica_connections) == 1
+
+
+def test_read_user_me_from_replica(
+    client: TestClient, db: Session, replica_connections: list[object]
+) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    client.cookies.clear()
+    invalidate_principal(user.id)
+    response = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["id"] == str(user.id)
+    assert len(replica_connections) == 1
+    # Users read from a replica aren't cached, they could be stale
+    assert principal_cache.get(str(user.id)) is None
+
+
+def test_read_your_writes_from_primary(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    replica_connections: list[object],
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        json={"title": "Foo"},
+    )
+    assert response.status_code == 200
+    assert READ_YOUR_WRITES_COOKIE in response.cookies
+    item_id = response.json()["id"]
+    response = client.get(
+        f"{settings.API_V1_STR}/items/{item_id}", headers=superuser_token_headers
+    )
+    assert response.status_code == 200
+    assert replica_connections == []
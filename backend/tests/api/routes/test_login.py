@@ -4,7 +4,7 @@ from fastapi.testclient import TestClient
 from sqlmodel import Session
 
 from app.core.config import settings
-from app.core.security import verify_password
+from app.core.security import password_hasher, verify_password
 from app.crud import create_user
 from app.models import UserCreate
 from app.utils import generate_password_reset_token
@@ -33,6 +33,98 @@ def test_get_access_token_incorrect_password(client: TestClient) -> None:
     assert r.status_code == 400
 
 
+def test_get_access_token_hashing_queue_full(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    with patch.object(password_hasher, "max_queue", -password_hasher.max_workers):
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 503
+    assert r.headers["Retry-After"]
+
+
+def test_refresh_token(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    refresh_token = r.json()["refresh_token"]
+    assert refresh_token
+
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        json={"refresh_token": refresh_token},
+    )
+    assert r.status_code == 200
+    tokens = r.json()
+    assert tokens["access_token"]
+    assert tokens["refresh_token"] != refresh_token
+    r = client.post(
+        f"{settings.API_V1_STR}/login/test-token",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+    )
+    assert r.status_code == 200
+
+    # Refresh tokens can only be used once
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        json={"refresh_token": refresh_token},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid refresh token"
+
+
+def test_refresh_token_revoked_by_password_reset(
+    client: TestClient, db: Session
+) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_create = UserCreate(email=email, password=password)
+    create_user(session=db, user_create=user_create)
+    r = client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": email, "password": password},
+    )
+    refresh_token = r.json()["refresh_token"]
+
+    token = generate_password_reset_token(email=email)
+    data = {"new_password": random_lower_string(), "token": token}
+    r = client.post(f"{settings.API_V1_STR}/reset-password/", json=data)
+    assert r.status_code == 200
+
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        json={"refresh_token": refresh_token},
+    )
+    assert r.status_code == 400
+
+
+def test_get_access_token_rate_limited(client: TestClient) -> None:
+    login_data = {"username": settings.FIRST_SUPERUSER, "password": "incorrect"}
+    for _ in range(settings.AUTH_RATE_LIMIT_ACCOUNT_BURST):
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+        assert r.status_code == 400
+    submitted = password_hasher.stats()["submitted"]
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 429
+    assert r.headers["Retry-After"]
+    # Rejected before any hashing work
+    assert password_hasher.stats()["submitted"] == submitted
+
+
+def test_get_access_token_success_not_rate_limited(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    # Only wrong passwords count against the account
+    for _ in range(settings.AUTH_RATE_LIMIT_ACCOUNT_BURST + 1):
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+        assert r.status_code == 200
+
+
 def test_use_access_token(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -72,6 +164,23 @@ def test_recovery_password_user_not_exits(
     assert r.status_code == 404
 
 
+def test_recovery_password_rate_limited_per_account(client: TestClient) -> None:
+    email = random_email()
+    # The account limit is lower than the IP one
+    for _ in range(settings.AUTH_RATE_LIMIT_ACCOUNT_BURST):
+        r = client.post(f"{settings.API_V1_STR}/password-recovery/{email}")
+        assert r.status_code == 404
+    r = client.post(f"{settings.API_V1_STR}/password-recovery/{email.upper()}")
+    assert r.status_code == 429
+    assert r.headers["Retry-After"]
+    # Logins of the account aren't limited by it
+    r = client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": email, "password": "incorrect"},
+    )
+    assert r.status_code == 400
+
+
 def test_reset_password(client: TestClient, db: Session) -> None:
     email = random_email()
     password = random_lower_string()
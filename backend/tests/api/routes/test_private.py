@@ -1,8 +1,10 @@
 from fastapi.testclient import TestClient
 from sqlmodel import Session, select
 
+from app import crud
 from app.core.config import settings
 from app.models import User
+from tests.utils.utils import random_email
 
 
 def test_create_user(client: TestClient, db: Session) -> None:
@@ -24,3 +26,21 @@ def test_create_user(client: TestClient, db: Session) -> None:
     assert user
     assert user.email == "pollo@listo.com"
     assert user.full_name == "Pollo Listo"
+
+
+def test_create_user_email_lower_case(client: TestClient, db: Session) -> None:
+    email = random_email()
+    r = client.post(
+        f"{settings.API_V1_STR}/private/users/",
+        json={
+            "email": email.upper(),
+            "password": "password123",
+            "full_name": "Pollo Listo",
+        },
+    )
+    assert r.status_code == 200
+    assert r.json()["email"] == email
+
+    user = crud.get_user_by_email(session=db, email=email)
+    assert user
+    assert user.email == email
@@ -1,14 +1,34 @@
+import asyncio
 import uuid
+from datetime import datetime, timedelta, timezone
+from typing import get_args
 from unittest.mock import patch
 
 from fastapi.testclient import TestClient
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import crud
 from app.core.config import settings
+from app.core.db import async_engine
+from app.core.jobs import Job
 from app.core.security import verify_password
-from app.models import User, UserCreate
-from tests.utils.utils import random_email, random_lower_string
+from app.main import purge_deleted_users
+from app.models import (
+    Item,
+    ItemCreate,
+    User,
+    UserCreate,
+    UserField,
+    UserPublic,
+    UserUpdate,
+)
+from tests.utils.user import create_random_user, user_authentication_headers
+from tests.utils.utils import (
+    random_email,
+    random_lower_string,
+    recorded_statements,
+)
 
 
 def test_get_users_superuser_me(
@@ -33,6 +53,31 @@ def test_get_users_normal_user_me(
     assert current_user["email"] == settings.EMAIL_TEST_USER
 
 
+def test_get_users_me_etag(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    url = f"{settings.API_V1_STR}/users/me"
+    r = client.get(url, headers=headers)
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+
+    r = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+
+    r = client.patch(url, headers=headers, json={"full_name": "Changed"})
+    assert r.status_code == 200
+    r = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["full_name"] == "Changed"
+    assert r.headers["etag"] != etag
+
+
 def test_create_user_new_email(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -75,6 +120,27 @@ def test_get_existing_user(
     assert existing_user.email == api_user["email"]
 
 
+def test_get_existing_user_etag(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=random_lower_string()),
+    )
+    url = f"{settings.API_V1_STR}/users/{user.id}"
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+
+    r = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+
+    crud.update_user(session=db, db_user=user, user_in=UserUpdate(full_name="Changed"))
+    r = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag
+
+
 def test_get_existing_user_current_user(client: TestClient, db: Session) -> None:
     username = random_email()
     password = random_lower_string()
@@ -168,6 +234,117 @@ def test_retrieve_users(
         assert "email" in item
 
 
+def test_retrieve_users_filters(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    token = random_lower_string()
+    users = [
+        crud.create_user(
+            session=db,
+            user_create=UserCreate(
+                email=f"{token}-{i}@example.com",
+                password=random_lower_string(),
+                full_name=f"{token} {i}",
+                is_active=i != 2,
+            ),
+        )
+        for i in range(3)
+    ]
+    ids = [str(user.id) for user in users]
+
+    def filtered(**params: str) -> list[str]:
+        r = client.get(
+            f"{settings.API_V1_STR}/users/",
+            headers=superuser_token_headers,
+            params=params,
+        )
+        assert r.status_code == 200
+        content = r.json()
+        assert content["count"] == len(content["data"])
+        return [user["id"] for user in content["data"]]
+
+    assert sorted(filtered(email_prefix=token.upper())) == sorted(ids)
+    assert filtered(email_prefix=f"{token}-1@") == [ids[1]]
+    assert filtered(email_prefix=token[1:]) == []
+    assert filtered(email_contains=f"{token[1:]}-2".upper()) == [ids[2]]
+    assert filtered(full_name_contains=f"{token[1:]} 0".upper()) == [ids[0]]
+    assert filtered(email_prefix=token, is_active="false") == [ids[2]]
+    assert sorted(filtered(email_prefix=token, is_active="true")) == sorted(ids[:2])
+    assert filtered(email_prefix=token, is_superuser="true") == []
+    # Wildcards are matched literally
+    assert filtered(email_contains="%") == []
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"email_contains": ""},
+    )
+    assert r.status_code == 422
+
+
+def test_retrieve_users_fields(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"fields": "id,email", "limit": 2},
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert len(content["data"]) == 2
+    for user in content["data"]:
+        assert set(user) == {"id", "email"}
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"fields": "hashed_password"},
+    )
+    assert r.status_code == 422
+
+
+def test_user_fields_are_public() -> None:
+    assert set(get_args(UserField)) == set(UserPublic.model_fields)
+
+
+def test_retrieve_users_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(3):
+        user_in = UserCreate(email=random_email(), password=random_lower_string())
+        crud.create_user(session=db, user_create=user_in)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 2},
+    )
+    first_page = r.json()
+    assert len(first_page["data"]) == 2
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 2, "cursor": first_page["next_cursor"]},
+    )
+    second_page = r.json()
+    assert second_page["data"]
+    ids = [user["id"] for user in first_page["data"] + second_page["data"]]
+    assert ids == sorted(set(ids))
+
+
+def test_retrieve_users_estimated_count(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"count": "estimated"},
+    )
+    assert r.status_code == 200
+    assert r.json()["count"] >= 0
+
+
 def test_update_user_me(
     client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -191,43 +368,62 @@ def test_update_user_me(
     assert user_db.full_name == full_name
 
 
-def test_update_password_me(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
-) -> None:
+def test_update_user_me_statements(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    # Authenticate once, so the user is cached
+    client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    with recorded_statements() as statements:
+        r = client.patch(
+            f"{settings.API_V1_STR}/users/me",
+            headers=headers,
+            json={"full_name": "Updated"},
+        )
+    assert r.status_code == 200
+    assert r.json()["full_name"] == "Updated"
+    assert statements == ["UPDATE"]
+
+
+def test_update_password_me(client: TestClient, db: Session) -> None:
+    # Changing the password revokes the tokens of the user, use a fresh user so
+    # that the module scoped token headers stay valid
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    headers = user_authentication_headers(client=client, email=email, password=password)
+
     new_password = random_lower_string()
     data = {
-        "current_password": settings.FIRST_SUPERUSER_PASSWORD,
+        "current_password": password,
         "new_password": new_password,
     }
     r = client.patch(
         f"{settings.API_V1_STR}/users/me/password",
-        headers=superuser_token_headers,
+        headers=headers,
         json=data,
     )
     assert r.status_code == 200
     updated_user = r.json()
     assert updated_user["message"] == "Password updated successfully"
 
-    user_query = select(User).where(User.email == settings.FIRST_SUPERUSER)
-    user_db = db.exec(user_query).first()
-    assert user_db
-    assert user_db.email == settings.FIRST_SUPERUSER
-    assert verify_password(new_password, user_db.hashed_password)
+    db.refresh(user)
+    assert verify_password(new_password, user.hashed_password)
+    assert user.token_version == 1
 
-    # Revert to the old password to keep consistency in test
-    old_data = {
-        "current_password": new_password,
-        "new_password": settings.FIRST_SUPERUSER_PASSWORD,
-    }
-    r = client.patch(
-        f"{settings.API_V1_STR}/users/me/password",
-        headers=superuser_token_headers,
-        json=old_data,
-    )
-    db.refresh(user_db)
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 403
 
+    headers = user_authentication_headers(
+        client=client, email=email, password=new_password
+    )
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
     assert r.status_code == 200
-    assert verify_password(settings.FIRST_SUPERUSER_PASSWORD, user_db.hashed_password)
 
 
 def test_update_password_me_incorrect_password(
@@ -320,6 +516,30 @@ def test_register_user_already_exists_error(client: TestClient) -> None:
     assert r.json()["detail"] == "The user with this email already exists in the system"
 
 
+def test_register_user_email_case(client: TestClient) -> None:
+    email = random_email()
+    password = random_lower_string()
+    r = client.post(
+        f"{settings.API_V1_STR}/users/signup",
+        json={"email": email.upper(), "password": password},
+    )
+    assert r.status_code == 200
+    assert r.json()["email"] == email
+
+    r = client.post(
+        f"{settings.API_V1_STR}/users/signup",
+        json={"email": email.capitalize(), "password": password},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "The user with this email already exists in the system"
+
+    r = client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": email.capitalize(), "password": password},
+    )
+    assert r.status_code == 200
+
+
 def test_update_user(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -346,6 +566,30 @@ def test_update_user(
     assert user_db.full_name == "Updated_full_name"
 
 
+def test_update_user_deactivate_revokes_tokens(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"is_active": False},
+    )
+    assert r.status_code == 200
+
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 403
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=headers)
+    assert r.status_code == 403
+
+
 def test_update_user_not_exists(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -402,9 +646,8 @@ def test_delete_user_me(client: TestClient, db: Session) -> None:
         f"{settings.API_V1_STR}/users/me",
         headers=headers,
     )
-    assert r.status_code == 200
-    deleted_user = r.json()
-    assert deleted_user["message"] == "User deleted successfully"
+    assert r.status_code == 202
+    assert r.json()["status"] == "running"
     result = db.exec(select(User).where(User.id == user_id)).first()
     assert result is None
 
@@ -433,15 +676,140 @@ def test_delete_user_super_user(
     user_in = UserCreate(email=username, password=password)
     user = crud.create_user(session=db, user_create=user_in)
     user_id = user.id
-    r = client.delete(
-        f"{settings.API_V1_STR}/users/{user_id}",
+    for _ in range(5):
+        crud.create_item(session=db, item_in=ItemCreate(title="Foo"), owner_id=user_id)
+    with (
+        patch("app.core.config.settings.USER_DELETE_BATCH_SIZE", 2),
+        recorded_statements() as statements,
+    ):
+        r = client.delete(
+            f"{settings.API_V1_STR}/users/{user_id}",
+            headers=superuser_token_headers,
+        )
+    assert r.status_code == 202
+    job_id = r.json()["id"]
+    # The user is marked as deleted by the request, then the items are
+    # deleted in batches of 2 and the user in the background
+    assert statements.count("UPDATE") == 1
+    assert statements.count("DELETE") == 4
+    r = client.get(
+        f"{settings.API_V1_STR}/users/deletions/{job_id}",
         headers=superuser_token_headers,
     )
     assert r.status_code == 200
-    deleted_user = r.json()
-    assert deleted_user["message"] == "User deleted successfully"
+    job = r.json()
+    assert job["status"] == "succeeded"
+    assert job["progress"] == {"items_deleted": 5}
+    db.expire_all()
     result = db.exec(select(User).where(User.id == user_id)).first()
     assert result is None
+    assert not db.exec(select(Item).where(Item.owner_id == user_id)).first()
+
+
+def test_deleted_user_cannot_log_in(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=password)
+    )
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    # A deletion interrupted before the items were deleted
+    user.deleted_at = datetime.now(timezone.utc)
+    user.is_active = False
+    user.token_version += 1
+    db.add(user)
+    db.commit()
+
+    r = client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": email, "password": password},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Incorrect email or password"
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 403
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"is_active": True},
+    )
+    assert r.status_code == 404
+
+    # Deleting it again resumes the deletion
+    r = client.delete(
+        f"{settings.API_V1_STR}/users/{user.id}", headers=superuser_token_headers
+    )
+    assert r.status_code == 202
+    user_id = user.id
+    db.expire_all()
+    assert db.get(User, user_id) is None
+
+
+def test_purge_deleted_users(client: TestClient, db: Session) -> None:
+    user = create_random_user(db)
+    for _ in range(3):
+        crud.create_item(session=db, item_in=ItemCreate(title="Foo"), owner_id=user.id)
+    # A deletion interrupted before the items were deleted, long enough ago
+    interval = timedelta(seconds=settings.USER_PURGE_SWEEP_INTERVAL_SECONDS)
+    user.deleted_at = datetime.now(timezone.utc) - 2 * interval
+    user.is_active = False
+    db.add(user)
+    recent_user = create_random_user(db)
+    recent_user.deleted_at = datetime.now(timezone.utc)
+    recent_user.is_active = False
+    db.add(recent_user)
+    db.commit()
+    user_id, recent_user_id = user.id, recent_user.id
+
+    # On the event loop of the app, where the async engine is used
+    assert client.portal
+    client.portal.call(purge_deleted_users)
+    db.expire_all()
+    assert db.get(User, user_id) is None
+    assert not db.exec(select(Item).where(Item.owner_id == user_id)).first()
+    # Possibly still being purged by the request that deleted it
+    assert db.get(User, recent_user_id) is not None
+
+
+def test_concurrent_purges(client: TestClient, db: Session) -> None:
+    user = create_random_user(db)
+    for _ in range(20):
+        crud.create_item(session=db, item_in=ItemCreate(title="Foo"), owner_id=user.id)
+    user.deleted_at = datetime.now(timezone.utc)
+    user.is_active = False
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    jobs = [Job(owner_id=user_id, progress={"items_deleted": 0}) for _ in range(2)]
+
+    async def purge(job: Job) -> None:
+        async with AsyncSession(async_engine) as session:
+            await crud.purge_user_async(
+                session=session, user_id=user_id, batch_size=2, job=job
+            )
+
+    async def purge_concurrently() -> None:
+        await asyncio.gather(*(purge(job) for job in jobs))
+
+    assert client.portal
+    client.portal.call(purge_concurrently)
+    db.expire_all()
+    assert db.get(User, user_id) is None
+    # Every item was deleted by a batch, none by cascading from the user
+    assert sum(job.progress["items_deleted"] for job in jobs) == 20
+
+
+def test_read_deletion_job_not_found(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/users/deletions/{uuid.uuid4()}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Job not found"
 
 
 def test_delete_user_not_found(
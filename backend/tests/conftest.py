@@ -6,6 +6,7 @@ from sqlmodel import Session, delete
 
 from app.core.config import settings
 from app.core.db import engine, init_db
+from app.core.ratelimit import auth_rate_limit_store
 from app.main import app
 from app.models import Item, User
 from tests.utils.user import authentication_token_from_email
@@ -24,6 +25,16 @@ def db() -> Generator[Session, None, None]:
         session.commit()
 
 
+@pytest.fixture(autouse=True)
+def reset_auth_rate_limits() -> Generator[None, None, None]:
+    # The whole test suite logs in from the same client, start each test with
+    # full buckets. Also clear them afterwards, the module scoped token fixtures
+    # of the next test log in before this fixture runs again
+    auth_rate_limit_store.clear()
+    yield
+    auth_rate_limit_store.clear()
+
+
 @pytest.fixture(scope="module")
 def client() -> Generator[TestClient, None, None]:
     with TestClient(app) as c:
@@ -0,0 +1,98 @@
+import uuid
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.core.cache import (
+    LocalInvalidationBus,
+    TTLCache,
+    invalidate_principal,
+    principal_cache,
+)
+from app.core.config import settings
+
+
+def test_ttl_cache_get_set() -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_ttl_cache_expires() -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=60)
+    with patch("app.core.cache.time.monotonic", return_value=1000.0):
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=5)
+    with patch("app.core.cache.time.monotonic", return_value=1010.0):
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+    with patch("app.core.cache.time.monotonic", return_value=1061.0):
+        assert cache.get("a") is None
+
+
+def test_ttl_cache_evicts_least_recently_used() -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_disabled() -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_local_invalidation_bus() -> None:
+    bus = LocalInvalidationBus()
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=60)
+    bus.subscribe("test", cache.invalidate)
+    cache.set("a", 1)
+    bus.publish("other", "a")
+    assert cache.get("a") == 1
+    bus.publish("test", "a")
+    assert cache.get("a") is None
+
+
+def test_invalidate_principal() -> None:
+    user_id = uuid.uuid4()
+    principal_cache.set(str(user_id), object())  # type: ignore[arg-type]
+    invalidate_principal(user_id)
+    assert principal_cache.get(str(user_id)) is None
+
+
+def test_principal_cache_hit(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    hits = principal_cache.hits
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert principal_cache.hits == hits + 1
+
+
+def test_principal_cache_invalidated_on_update(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    user_id = r.json()["id"]
+    assert principal_cache.get(user_id) is not None
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/me",
+        headers=normal_user_token_headers,
+        json={"full_name": "Cached Name"},
+    )
+    assert r.status_code == 200
+    assert principal_cache.get(user_id) is None
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    assert r.json()["full_name"] == "Cached Name"
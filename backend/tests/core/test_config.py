@@ -0,0 +1,18 @@
+import pytest
+
+from app.core.config import parse_servers
+
+
+def test_parse_servers() -> None:
+    assert parse_servers("replica-1, replica-2:5433,") == [
+        "replica-1",
+        "replica-2:5433",
+    ]
+    assert parse_servers(["replica-1"]) == ["replica-1"]
+    assert parse_servers("") == []
+
+
+@pytest.mark.parametrize("value", [":5432", "replica:port", ["replica:"], 1])
+def test_parse_servers_invalid(value: object) -> None:
+    with pytest.raises(ValueError):
+        parse_servers(value)
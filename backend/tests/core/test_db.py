@@ -0,0 +1,29 @@
+from unittest.mock import patch
+
+from sqlmodel import Session, func, select
+
+from app.core.config import settings
+from app.core.db import engine, init_db, pool_stats
+from app.models import User
+
+
+def test_pool_stats() -> None:
+    before = pool_stats(engine)
+    with Session(engine) as session:
+        session.exec(select(1))
+        during = pool_stats(engine)
+    after = pool_stats(engine)
+    assert during["checkouts"] == before["checkouts"] + 1
+    assert during["in_use"] == before["in_use"] + 1
+    assert after["in_use"] == before["in_use"]
+    assert after["checkout_wait_seconds_total"] >= before["checkout_wait_seconds_total"]
+    assert after["size"] == engine.pool.size()  # type: ignore[attr-defined]
+
+
+def test_init_db_superuser_email_case(db: Session) -> None:
+    email = settings.FIRST_SUPERUSER.upper()
+    # Run again on every start, the user already exists in lower case
+    with patch("app.core.config.settings.FIRST_SUPERUSER", email):
+        init_db(db)
+    statement = select(func.count()).where(func.lower(User.email) == email.lower())
+    assert db.exec(statement).one() == 1
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from app.core.hashing import HashingQueueFullError, PasswordHasher
+
+
+def test_hash_and_verify() -> None:
+    hasher = PasswordHasher(max_workers=1, max_queue=1)
+    try:
+        hashed_password = hasher.hash_blocking("secret-password")
+        assert hashed_password != "secret-password"
+        assert hasher.verify_blocking("secret-password", hashed_password)
+        assert not hasher.verify_blocking("wrong-password", hashed_password)
+        stats = hasher.stats()
+        assert stats["completed"] == 3
+        assert stats["in_flight"] == 0
+        assert stats["hash_seconds_total"] > 0
+        assert stats["queue_wait_seconds_total"] >= 0
+    finally:
+        hasher.shutdown()
+
+
+def test_hash_async() -> None:
+    hasher = PasswordHasher(max_workers=1, max_queue=1)
+
+    async def run() -> None:
+        hashed_password = await hasher.hash("secret-password")
+        assert await hasher.verify("secret-password", hashed_password)
+
+    try:
+        asyncio.run(run())
+    finally:
+        hasher.shutdown()
+
+
+def test_queue_full() -> None:
+    hasher = PasswordHasher(max_workers=1, max_queue=0)
+
+    async def run() -> None:
+        first = asyncio.create_task(hasher.hash("secret-password"))
+        await asyncio.sleep(0)
+        with pytest.raises(HashingQueueFullError):
+            await hasher.hash("other-password")
+        await first
+
+    try:
+        asyncio.run(run())
+        assert hasher.stats()["rejected"] == 1
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,18 @@
+import uuid
+
+import pytest
+
+from app.core.pagination import InvalidCursorError, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip() -> None:
+    item_id = uuid.uuid4()
+    cursor = encode_cursor(0.5, item_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == [0.5, str(item_id)]
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", encode_cursor(1, 2)])
+def test_invalid_cursor(cursor: str) -> None:
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, 1)
@@ -0,0 +1,76 @@
+import ipaddress
+from unittest.mock import patch
+
+from app.core.ratelimit import InMemoryTokenBucketStore, RateLimiter, client_ip
+
+
+def test_rate_limiter_burst_and_refill() -> None:
+    limiter = RateLimiter(
+        name="test",
+        burst=2,
+        per_minute=60,
+        store=InMemoryTokenBucketStore(maxsize=10),
+    )
+    with patch("app.core.ratelimit.time.monotonic", return_value=100.0):
+        assert limiter.hit("a") == 0
+        assert limiter.hit("a") == 0
+        assert limiter.hit("a") == 1.0
+        assert limiter.hit("b") == 0
+    with patch("app.core.ratelimit.time.monotonic", return_value=101.0):
+        assert limiter.hit("a") == 0
+    assert limiter.stats() == {"allowed": 4, "rejected": 1}
+
+
+def test_rate_limiter_check() -> None:
+    limiter = RateLimiter(
+        name="test",
+        burst=1,
+        per_minute=60,
+        store=InMemoryTokenBucketStore(maxsize=10),
+    )
+    with patch("app.core.ratelimit.time.monotonic", return_value=100.0):
+        # Checking doesn't take the token
+        assert limiter.check("a") == 0
+        assert limiter.check("a") == 0
+        assert limiter.hit("a") == 0
+        assert limiter.check("a") == 1.0
+    assert limiter.stats() == {"allowed": 3, "rejected": 1}
+
+
+def test_client_ip() -> None:
+    proxies = [
+        ipaddress.ip_network("10.0.0.0/8"),
+        ipaddress.ip_network("::1/128"),
+    ]
+    # Not from a proxy, the header could be set by anyone
+    assert client_ip("1.2.3.4", ["5.6.7.8"], proxies) == "1.2.3.4"
+    assert client_ip("testclient", ["5.6.7.8"], proxies) == "testclient"
+    assert client_ip("10.0.0.2", [], proxies) == "10.0.0.2"
+    # The addresses before the last untrusted one could be spoofed by it
+    assert client_ip("10.0.0.2", ["6.6.6.6, 1.2.3.4"], proxies) == "1.2.3.4"
+    assert client_ip("10.0.0.2", ["6.6.6.6", "1.2.3.4, 10.0.0.3"], proxies) == (
+        "1.2.3.4"
+    )
+    assert client_ip("::1", ["10.0.0.3"], proxies) == "10.0.0.3"
+    assert client_ip("10.0.0.2", ["not an ip"], proxies) == "not an ip"
+
+
+def test_rate_limiter_disabled() -> None:
+    limiter = RateLimiter(
+        name="test",
+        burst=0,
+        per_minute=60,
+        store=InMemoryTokenBucketStore(maxsize=10),
+    )
+    for _ in range(10):
+        assert limiter.hit("a") == 0
+
+
+def test_in_memory_store_drops_least_recently_used() -> None:
+    store = InMemoryTokenBucketStore(maxsize=1)
+    with patch("app.core.ratelimit.time.monotonic", return_value=100.0):
+        assert store.take("a", capacity=1, refill_per_second=0.01) == 0
+        assert store.take("a", capacity=1, refill_per_second=0.01) > 0
+        assert store.take("b", capacity=1, refill_per_second=0.01) == 0
+        # "a" was dropped, it starts over with a full bucket
+        assert store.take("a", capacity=1, refill_per_second=0.01) == 0
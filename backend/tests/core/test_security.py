@@ -0,0 +1,47 @@
+import hashlib
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+import jwt
+import pytest
+
+from app.core.security import create_access_token, decode_access_token, token_cache
+
+
+def test_decode_access_token() -> None:
+    token = create_access_token("some-user", expires_delta=timedelta(minutes=5))
+    token_data = decode_access_token(token)
+    assert token_data.sub == "some-user"
+    hits = token_cache.hits
+    assert decode_access_token(token) is token_data
+    assert token_cache.hits == hits + 1
+
+
+def test_decode_access_token_invalid() -> None:
+    with pytest.raises(jwt.InvalidTokenError):
+        decode_access_token("not-a-token")
+
+
+def test_decode_access_token_cache_bounded_by_expiration() -> None:
+    token = create_access_token("some-user", expires_delta=timedelta(seconds=30))
+    decode_access_token(token)
+    key = hashlib.sha256(token.encode()).digest()
+    assert token_cache.get(key) is not None
+    later = time.monotonic() + 31
+    with patch("app.core.cache.time.monotonic", return_value=later):
+        assert token_cache.get(key) is None
+
+
+def test_create_access_token_claims() -> None:
+    token = create_access_token(
+        "some-user",
+        expires_delta=timedelta(minutes=5),
+        is_superuser=True,
+        is_active=True,
+        token_version=3,
+    )
+    token_data = decode_access_token(token)
+    assert token_data.is_superuser is True
+    assert token_data.is_active is True
+    assert token_data.token_version == 3
@@ -1,10 +1,18 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
 from fastapi.encoders import jsonable_encoder
-from sqlmodel import Session
+from sqlmodel import Session, col, func, insert, select
 
 from app import crud
-from app.core.security import verify_password
-from app.models import User, UserCreate, UserUpdate
-from tests.utils.utils import random_email, random_lower_string
+from app.core.db import engine
+from app.core.security import hash_refresh_token, verify_password
+from app.models import Item, RefreshToken, User, UserCreate, UserUpdate
+from tests.utils.utils import (
+    random_email,
+    random_lower_string,
+    recorded_statements,
+)
 
 
 def test_create_user(db: Session) -> None:
@@ -33,6 +41,16 @@ def test_not_authenticate_user(db: Session) -> None:
     assert user is None
 
 
+def test_get_user_by_email_case_insensitive(db: Session) -> None:
+    email = random_email()
+    user_in = UserCreate(email=email.upper(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    assert user.email == email
+    found = crud.get_user_by_email(session=db, email=email.capitalize())
+    assert found
+    assert found.id == user.id
+
+
 def test_check_if_user_is_active(db: Session) -> None:
     email = random_email()
     password = random_lower_string()
@@ -89,3 +107,97 @@ def test_update_user(db: Session) -> None:
     assert user_2
     assert user.email == user_2.email
     assert verify_password(new_password, user_2.hashed_password)
+
+
+def test_rotate_refresh_token(db: Session) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    token = crud.create_refresh_token(session=db, user=user)
+    rotated = crud.rotate_refresh_token(session=db, token=token)
+    assert rotated
+    rotated_user, new_token = rotated
+    assert rotated_user.id == user.id
+    assert new_token != token
+    assert crud.rotate_refresh_token(session=db, token=token) is None
+
+
+def test_delete_expired_refresh_tokens(db: Session) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    expired_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    for _ in range(5):
+        db.add(
+            RefreshToken(
+                token_hash=hash_refresh_token(random_lower_string()),
+                user_id=user.id,
+                token_version=user.token_version,
+                expires_at=expired_at,
+            )
+        )
+    db.commit()
+    token = crud.create_refresh_token(session=db, user=user)
+
+    assert crud.delete_expired_refresh_tokens(session=db, batch_size=2) >= 5
+    expired = db.exec(
+        select(RefreshToken).where(RefreshToken.expires_at <= expired_at)
+    ).all()
+    assert expired == []
+    assert crud.rotate_refresh_token(session=db, token=token)
+
+
+def test_delete_user_cascades_in_database(db: Session) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    user_id = user.id
+    db.execute(
+        insert(Item),
+        [
+            {"id": uuid.uuid4(), "title": f"item {i}", "owner_id": user_id}
+            for i in range(10_000)
+        ],
+    )
+    db.commit()
+    db.refresh(user)
+    # The items are neither loaded nor deleted one by one by the ORM
+    with recorded_statements(engine) as statements:
+        db.delete(user)
+        db.commit()
+    assert statements == ["DELETE"]
+    count = select(func.count()).where(col(Item.owner_id) == user_id)
+    assert db.exec(count).one() == 0
+
+
+def test_update_user_version_not_lost(db: Session) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    version = user.version
+    with Session(engine) as other_session:
+        stale_user = other_session.get(User, user.id)
+        assert stale_user
+        user.full_name = "First"
+        db.commit()
+        # Still loaded with the version before the first update
+        stale_user.full_name = "Second"
+        other_session.commit()
+    db.refresh(user)
+    assert user.version == version + 2
+
+
+def test_update_user_token_version_not_lost(db: Session) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    token_version = user.token_version
+    with Session(engine) as other_session:
+        stale_user = other_session.get(User, user.id)
+        assert stale_user
+        crud.update_user(
+            session=db, db_user=user, user_in=UserUpdate(password="new password")
+        )
+        # Still loaded with the token version before the password change
+        crud.update_user(
+            session=other_session,
+            db_user=stale_user,
+            user_in=UserUpdate(is_active=False),
+        )
+    db.refresh(user)
+    assert user.token_version == token_version + 2
@@ -0,0 +1,68 @@
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Any
+
+from app.imports import (
+    IMPORT_MAX_LINE_LENGTH,
+    ImportFormat,
+    RejectedRowError,
+    parse_rows,
+)
+
+
+def parse(body: bytes, format: ImportFormat) -> list[tuple[int, Any]]:
+    async def chunks() -> AsyncIterator[bytes]:
+        # Small chunks, so that rows and characters are split between them
+        for i in range(0, len(body), 3):
+            yield body[i : i + 3]
+
+    async def collect() -> list[tuple[int, Any]]:
+        return [
+            (line, str(row) if isinstance(row, RejectedRowError) else row)
+            async for line, row in parse_rows(chunks(), format)
+        ]
+
+    return asyncio.run(collect())
+
+
+def test_parse_ndjson() -> None:
+    body = '{"title": "Foo"}\n\n{"title": "Bär"\n[1]\n{"title": "Baz"}'.encode()
+    assert parse(body, "ndjson") == [
+        (1, {"title": "Foo"}),
+        (3, "Invalid JSON: Expecting ',' delimiter"),
+        (4, "Expected a JSON object"),
+        (5, {"title": "Baz"}),
+    ]
+
+
+def test_parse_csv() -> None:
+    body = (
+        'title,description\r\nFoo,\r\n"Bar, ""baz""","multi\nline"\nQux\n\xff,x\n'
+    ).encode("latin-1")
+    assert parse(body, "csv") == [
+        (2, {"title": "Foo"}),
+        (3, {"title": 'Bar, "baz"', "description": "multi\nline"}),
+        (5, "Expected 2 fields, got 1"),
+        (6, "Not valid UTF-8"),
+    ]
+
+
+def test_parse_csv_unterminated_quote() -> None:
+    assert parse(b'title\n"Foo\n', "csv") == [(2, "Unterminated quoted field")]
+
+
+def test_parse_long_lines() -> None:
+    long_title = "x" * IMPORT_MAX_LINE_LENGTH
+    body = f'{{"title": "{long_title}"}}\n{{"title": "Foo"}}\n{long_title}x'.encode()
+    assert parse(body, "ndjson") == [
+        (1, f"Longer than {IMPORT_MAX_LINE_LENGTH} bytes"),
+        (2, {"title": "Foo"}),
+        (3, f"Longer than {IMPORT_MAX_LINE_LENGTH} bytes"),
+    ]
+    # Lines of a quoted field count towards the same limit
+    line = "y" * (IMPORT_MAX_LINE_LENGTH // 2)
+    body = f'title,description\nFoo,"{line}\n{line}"\nBar,\n'.encode()
+    assert parse(body, "csv") == [
+        (2, f"Longer than {IMPORT_MAX_LINE_LENGTH} bytes"),
+        (4, {"title": "Bar"}),
+    ]
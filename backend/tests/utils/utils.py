@@ -1,9 +1,14 @@
 import random
 import string
+from collections.abc import Generator
+from contextlib import contextmanager
+from typing import Any
 
 from fastapi.testclient import TestClient
+from sqlalchemy import Engine, event
 
 from app.core.config import settings
+from app.core.db import async_engine
 
 
 def random_lower_string() -> str:
@@ -24,3 +29,23 @@ def get_superuser_token_headers(client: TestClient) -> dict[str, str]:
     a_token = tokens["access_token"]
     headers = {"Authorization": f"Bearer {a_token}"}
     return headers
+
+
+@contextmanager
+def recorded_statements(
+    engine: Engine = async_engine.sync_engine,
+) -> Generator[list[str], None, None]:
+    """
+    Kinds (SELECT, INSERT...) of the statements run in the block, by the API
+    unless another engine is given.
+    """
+    statements: list[str] = []
+
+    def record(_conn: Any, _cursor: Any, statement: str, *_args: Any) -> None:
+        statements.append(statement.split(None, 1)[0].upper())
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)